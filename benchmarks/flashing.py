@@ -0,0 +1,305 @@
+"""
+End-to-end flashing benchmark against the simulated device, no hardware needed.
+
+Every scenario flashes a synthetic merged image (bootloader, partition table,
+NVS, otadata and a 1 MB app slot) to a SimulatedDevice over a pty or socket://
+link timed like a real UART. Each run happens in a fresh child process, so CPU
+time and peak memory belong to that run alone. The result is checked against
+the simulated flash, then reported per phase together with throughput.
+
+    python -m benchmarks.flashing [--scenario NAME ...] [--baud 921600] [--repeat 3]
+                                  [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.events import PHASES
+from src.regions import sparse_regions
+from src.simulator import SimulatedDevice
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "api-full": {"options": {}},
+    # Second board of a station run: the compressed payload is already cached
+    "api-full-cached": {"options": {}, "warm_cache": True},
+    "api-sparse": {"options": {"write_mode": "sparse"}},
+    # Device already holds the previous build, which differs in one place
+    "api-diff": {"options": {"write_mode": "diff"}, "preload": "previous"},
+    "subprocess-full": {"options": {"engine": "subprocess"}},
+    # Provisioning: flash, write NVS, verify, read MAC and security info on one connection...
+    "pipeline-session": {"options": {}, "pipeline": True, "transport": "socket"},
+    # ...and the same steps with a connect, stub upload and reset for each of them. Over
+    # socket:// so every connection really starts from the ROM (a pty can't reset the device)
+    "pipeline-reconnect": {"options": {}, "pipeline": True, "reconnect": True, "transport": "socket"},
+}
+
+APP_OFFSET = 0x10000
+APP_SLOT_SIZE = 0x100000
+NVS_OFFSET = 0x9000
+NVS_SIZE = 0x5000
+
+
+def _firmware_like(size, rng):
+    """Bytes that compress about as well as real firmware does (roughly 60%)."""
+    vocabulary = [rng.randbytes(16) for _ in range(64)]
+    chunks = []
+    while sum(map(len, chunks)) < size:
+        chunks.append(rng.randbytes(96))
+        chunks.extend(rng.choice(vocabulary) for _ in range(10))
+    return b"".join(chunks)[:size]
+
+
+def build_image(app_size=600 * 1024, seed=0):
+    """A merged image laid out the way ESP-IDF builds them for a 4 MB part."""
+    rng = random.Random(seed)
+    image = bytearray(b"\xff" * (APP_OFFSET + app_size))
+    image[0x1000:0x1000 + 24 * 1024] = _firmware_like(24 * 1024, rng)
+    entries = [
+        (0x01, 0x02, NVS_OFFSET, NVS_SIZE, b"nvs"),
+        (0x01, 0x00, 0xE000, 0x2000, b"otadata"),
+        (0x00, 0x10, APP_OFFSET, APP_SLOT_SIZE, b"ota_0"),
+    ]
+    table = b"".join(struct.pack("<2sBBII16sI", b"\xaa\x50", type_, subtype, offset, size, label, 0)
+                     for type_, subtype, offset, size, label in entries)
+    image[0x8000:0x8000 + len(table)] = table
+    image[APP_OFFSET:] = _firmware_like(app_size, rng)
+    return bytes(image)
+
+
+def build_nvs():
+    """Stand-in for a per-unit NVS partition image."""
+    return _firmware_like(NVS_SIZE, random.Random(1))
+
+
+def provisioning_pipeline(image_path, image):
+    return [
+        ("flash_file", {"path": image_path}),
+        ("write_partition", {"name": "nvs", "data": build_nvs()}),
+        ("verify", {"address": APP_OFFSET, "data": image[APP_OFFSET:]}),
+        "read_mac",
+        "security_info",
+    ]
+
+
+def _expected_regions(image, settings):
+    """(address, data) the flash must hold after the scenario ran."""
+    options = settings["options"]
+    if settings.get("pipeline"):
+        return [(0, image[:NVS_OFFSET] + build_nvs() + image[NVS_OFFSET + NVS_SIZE:])]
+    if options.get("write_mode") == "sparse":
+        writes, erases, _ = sparse_regions(image)
+        return writes + [(address, b"\xff" * size) for address, size in erases]
+    return [(0, image)]
+
+
+# Child side: runs one flash and prints its measurements as JSON
+
+
+def run_child(scenario, port, image_path, baud):
+    from src.events import EventStream, PhaseEvent
+    from src.flasher import FlasherInterface
+    from src.payload_cache import PayloadCache
+    from src.session import DeviceSession
+
+    settings = SCENARIOS[scenario]
+    options = dict(settings["options"])
+    if settings.get("warm_cache"):
+        options["payload_cache"] = PayloadCache()
+        with open(image_path, "rb") as f:
+            options["payload_cache"].get(f.read())
+
+    phases = []
+    events = EventStream()
+    events.subscribe(lambda event: phases.append((event.phase, time.monotonic())), PhaseEvent)
+    if settings.get("pipeline"):
+        with open(image_path, "rb") as f:
+            pipeline = provisioning_pipeline(image_path, f.read())
+        if settings.get("reconnect"):
+            # A session per step: connect, stub upload and reset every time
+            sessions = [DeviceSession(port, baud_rate=baud, events=events, **options) for _ in pipeline]
+            runs = [(session, [step]) for session, step in zip(sessions, pipeline)]
+        else:
+            sessions = [DeviceSession(port, baud_rate=baud, events=events, **options)]
+            runs = [(sessions[0], pipeline)]
+        flasher = sessions[0].flasher
+
+    else:
+        flasher = FlasherInterface(port, image_path, baud_rate=baud, events=events, **options)
+
+    started = time.monotonic()
+    if settings.get("pipeline"):
+        try:
+            for session, steps in runs:
+                session.run(steps)
+            success = True
+        except Exception as e:
+            flasher.last_error = str(e)
+            success = False
+    else:
+        success = flasher.flash()
+    finished = time.monotonic()
+
+    timings = {}
+    marks = phases + [(None, finished)]
+    for (phase, start), (_, end) in zip(marks, marks[1:]):
+        timings[phase] = timings.get(phase, 0.0) + end - start
+    timings["setup"] = (phases[0][1] if phases else finished) - started
+
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    json.dump({
+        "success": success,
+        "error": flasher.last_error,
+        "elapsed": finished - started,
+        "phases": timings,
+        "cpu": sum(u.ru_utime + u.ru_stime for u in usage),
+        # ru_maxrss is in KB on Linux
+        "peak_rss": max(u.ru_maxrss for u in usage) * 1024,
+        "report": flasher.write_report,
+    }, sys.stdout)
+
+
+# Parent side: runs the simulator and one child per measurement
+
+
+def run_scenario(scenario, image, image_path, args):
+    settings = SCENARIOS[scenario]
+    device = SimulatedDevice(throttle=not args.no_throttle, write_rate=args.write_rate)
+    if settings.get("preload") == "previous":
+        previous = bytearray(image)
+        previous[APP_OFFSET + 0x20000] ^= 0xFF
+        device.flash[:len(previous)] = previous
+    try:
+        transport = settings.get("transport", args.transport)
+        port = device.listen() if transport == "socket" else device.open_pty()
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.flashing", "--child", scenario,
+             "--port", port, "--image", image_path, "--baud", str(args.baud)],
+            cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=600)
+    finally:
+        device.close()
+
+    if child.returncode != 0:
+        raise RuntimeError(child.stderr.strip().splitlines()[-1] if child.stderr.strip() else "child failed")
+    result = json.loads(child.stdout)
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    for address, data in _expected_regions(image, settings):
+        if device.flash[address:address + len(data)] != data:
+            raise RuntimeError(f"flash contents differ from the image at {address:#x}")
+    result["bytes_per_second"] = len(image) / result["elapsed"]
+    result["wire_bytes"] = device.stats["bytes_in"] + device.stats["bytes_out"]
+    return result
+
+
+def _median_result(results):
+    median = {
+        key: statistics.median(r[key] for r in results)
+        for key in ("elapsed", "cpu", "peak_rss", "bytes_per_second", "wire_bytes")
+    }
+    phases = {phase for r in results for phase in r["phases"]}
+    median["phases"] = {phase: statistics.median(r["phases"].get(phase, 0.0) for r in results)
+                        for phase in phases}
+    return median
+
+
+def print_table(summary):
+    columns = ["setup"] + list(PHASES)
+    print(f"{'scenario':<18} {'total':>7} " + " ".join(f"{c:>7}" for c in columns)
+          + f" {'KB/s':>7} {'cpu':>6} {'peak MB':>8} {'wire KB':>8}")
+    for name, result in summary.items():
+        if "error" in result:
+            print(f"{name:<18} failed: {result['error']}")
+            continue
+        phases = " ".join(f"{result['phases'].get(c, 0.0):7.2f}" for c in columns)
+        print(f"{name:<18} {result['elapsed']:7.2f} {phases} {result['bytes_per_second'] / 1024:7.0f} "
+              f"{result['cpu']:6.2f} {result['peak_rss'] / 2 ** 20:8.1f} {result['wire_bytes'] / 1024:8.0f}")
+
+
+def compare(summary, baseline, tolerance):
+    """Prints how each scenario moved against a baseline; returns the names that got slower."""
+    regressions = []
+    for name, result in summary.items():
+        before = baseline.get(name)
+        if before is None or "error" in before or "error" in result:
+            continue
+        change = result["elapsed"] / before["elapsed"] - 1
+        cpu_change = result["cpu"] / before["cpu"] - 1 if before["cpu"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  <-- slower"
+        print(f"{name:<18} time {change:+7.1%}  cpu {cpu_change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, can be given more than once (default: all)")
+    parser.add_argument("--baud", type=int, default=921600)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the median is reported")
+    parser.add_argument("--transport", choices=("pty", "socket"), default="pty")
+    parser.add_argument("--no-throttle", action="store_true",
+                        help="don't time the link like a UART, to measure host-side overhead only")
+    parser.add_argument("--write-rate", type=float, default=None,
+                        help="simulated flash programming speed in bytes/s (default: instant)")
+    parser.add_argument("--image", help="firmware to flash instead of the synthetic merged image")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="baseline results file from --json to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="slowdown against the baseline that counts as a regression (default 0.10)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--port", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.port, args.image, args.baud)
+        return 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.image:
+            image_path = os.path.abspath(args.image)
+            with open(image_path, "rb") as f:
+                image = f.read()
+        else:
+            image = build_image()
+            image_path = os.path.join(workdir, "benchmark.merged.bin")
+            with open(image_path, "wb") as f:
+                f.write(image)
+
+        print(f"Image {len(image) / 1024:.0f} KB at {args.baud} baud over {args.transport}"
+              f"{'' if not args.no_throttle else ' (unthrottled)'}, {args.repeat} run(s) each; "
+              f"pipeline scenarios always use socket://\n")
+        summary = {}
+        for name in args.scenario or SCENARIOS:
+            try:
+                summary[name] = _median_result([run_scenario(name, image, image_path, args)
+                                                for _ in range(args.repeat)])
+            except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+                summary[name] = {"error": str(e)}
+        print_table(summary)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        if compare(summary, baseline, args.tolerance):
+            return 1
+    return 1 if any("error" in result for result in summary.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Startup benchmark: time from launching a mode to the first byte on the serial port.
+
+Each mode is started against the slave end of a pseudo-terminal; the clock stops
+when esptool's first SYNC packet shows up on the master end. Nothing answers the
+sync, so the process is killed right after. Linux and macOS only (needs pty).
+
+    python -m benchmarks.startup [--repeat N] [--mode NAME ...]
+"""
+import argparse
+import json
+import os
+import pty
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_BYTE_TIMEOUT = 30.0
+
+
+def _esptool_args(port):
+    # --before default-reset is what the app uses; on a pty the DTR/RTS toggling
+    # is skipped with a warning, so the reset delays are not part of the timing
+    return ["--port", port, "--baud", "115200", "--connect-attempts", "1", "chip-id"]
+
+
+def _batch_command(port, workdir, engine):
+    manifest = os.path.join(workdir, f"manifest-{engine}.json")
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump({"firmware": "firmware.bin", "baud": 115200, "engine": engine,
+                   "max_attempts": 1, "jobs": [port]}, f)
+    return [sys.executable, "-m", "src.main", "--batch", manifest,
+            "--results", os.path.join(workdir, "results.jsonl")]
+
+
+MODES = {
+    # What the subprocess engine runs when started from source
+    "esptool-module": lambda port, workdir: [sys.executable, "-m", "esptool"] + _esptool_args(port),
+    # What the subprocess engine runs in a frozen build
+    "wrapper": lambda port, workdir: [sys.executable, "-m", "src.main", "--esptool-wrapper"] + _esptool_args(port),
+    # The wrapper as it was before lazy imports: GUI toolkit loaded first
+    "wrapper-eager-gui": lambda port, workdir: [
+        sys.executable, "-c",
+        "import sys, customtkinter, src.gui, esptool; esptool.main(sys.argv[1:])",
+    ] + _esptool_args(port),
+    "batch-api": lambda port, workdir: _batch_command(port, workdir, "api"),
+    "batch-subprocess": lambda port, workdir: _batch_command(port, workdir, "subprocess"),
+}
+
+
+def time_to_first_byte(build_command, workdir):
+    """Launches one process on a fresh pty; returns seconds until its first serial byte."""
+    master, slave = pty.openpty()
+    port = os.ttyname(slave)
+    process = None
+    try:
+        started = time.perf_counter()
+        process = subprocess.Popen(build_command(port, workdir), cwd=REPO_ROOT,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        readable, _, _ = select.select([master], [], [], FIRST_BYTE_TIMEOUT)
+        elapsed = time.perf_counter() - started
+        if not readable:
+            raise RuntimeError(f"no serial traffic within {FIRST_BYTE_TIMEOUT:.0f}s")
+        return elapsed
+    finally:
+        if process is not None:
+            process.kill()
+            process.wait()
+        os.close(master)
+        os.close(slave)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per mode (default 5)")
+    parser.add_argument("--mode", action="append", choices=sorted(MODES),
+                        help="mode to measure, can be given more than once (default: all)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "firmware.bin"), "wb") as f:
+            f.write(b"\xff" * 0x1000)
+
+        print(f"{'mode':<20} {'min':>8} {'median':>8} {'max':>8}")
+        for name in args.mode or MODES:
+            try:
+                samples = [time_to_first_byte(MODES[name], workdir) for _ in range(args.repeat)]
+            except (OSError, RuntimeError) as e:
+                print(f"{name:<20} failed: {e}")
+                continue
+            print(f"{name:<20} {min(samples) * 1000:7.0f}ms {statistics.median(samples) * 1000:7.0f}ms "
+                  f"{max(samples) * 1000:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
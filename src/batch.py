@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from src.events import JsonLinesSink, LogEvent
+from src.flasher import FlasherInterface
+from src.station import CANCELLED, DONE, FAILED, FlashStation
+
+# Manifest keys and the FlasherInterface arguments they set
+MANIFEST_OPTIONS = {
+    "firmware": "firmware_path",
+    "offset": "flash_offset",
+    "baud": "baud_rate",
+    "chip": "chip_type",
+    "engine": "engine",
+    "write_mode": "write_mode",
+    "diff_block_size": "diff_block_size",
+    "reset_delay": "reset_delay",
+}
+
+
+def _parse_int(value, key):
+    """Accepts ints and strings like "0x10000" for addresses and sizes."""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value), 0)
+    except ValueError:
+        raise ValueError(f"Manifest: {key} must be a number, got {value!r}")
+
+
+def _parse_seconds(value, key):
+    """Accepts numbers and numeric strings for delays in seconds."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Manifest: {key} must be a number of seconds, got {value!r}")
+    if seconds < 0:
+        raise ValueError(f"Manifest: {key} can't be negative, got {value!r}")
+    return seconds
+
+
+def _parse_count(value, key):
+    """A positive whole number, such as a worker or attempt count."""
+    count = _parse_int(value, key)
+    if count < 1:
+        raise ValueError(f"Manifest: {key} must be at least 1, got {value!r}")
+    return count
+
+
+def _options(entry, base_dir, where):
+    options = {}
+    for key, value in entry.items():
+        if key == "port":
+            continue
+        if key not in MANIFEST_OPTIONS:
+            raise ValueError(f"Manifest: unknown key {key!r} in {where}")
+        if key == "firmware":
+            value = os.path.join(base_dir, value)
+        elif key in ("offset", "diff_block_size"):
+            value = _parse_int(value, key)
+        elif key == "baud" and value != "auto":
+            value = _parse_int(value, key)
+        elif key == "reset_delay":
+            value = _parse_seconds(value, key)
+        options[MANIFEST_OPTIONS[key]] = value
+    return options
+
+
+def load_manifest(path):
+    """
+    Reads a batch manifest and returns (station_settings, defaults, jobs).
+
+    The manifest is a JSON object with the default flashing options (firmware,
+    offset, baud, chip, engine, write_mode, ...), optional max_workers (every
+    job at once by default) and max_attempts, and a "jobs" list. Each job is a port name or an object with
+    a "port" and any options that differ for that port. "jobs": "all" flashes
+    every detected port. Firmware paths are relative to the manifest.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest must be a JSON object")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    manifest = dict(manifest)
+    max_workers = manifest.pop("max_workers", None)
+    station_settings = {
+        "max_attempts": _parse_count(manifest.pop("max_attempts", 2), "max_attempts"),
+    }
+    entries = manifest.pop("jobs", None)
+    defaults = _options(manifest, base_dir, "manifest")
+
+    if entries == "all":
+        entries = FlashStation(None).list_ports()
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Manifest: \"jobs\" must be a non-empty list of ports, or \"all\"")
+
+    jobs = []
+    for i, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"port": entry}
+        if not isinstance(entry, dict) or not entry.get("port"):
+            raise ValueError(f"Manifest: job {i} needs a port")
+        options = _options(entry, base_dir, f"job {i}")
+        merged = dict(defaults, **options)
+        if "firmware_path" not in merged:
+            raise ValueError(f"Manifest: no firmware for {entry['port']}")
+        if not os.path.isfile(merged["firmware_path"]):
+            raise ValueError(f"Manifest: firmware not found: {merged['firmware_path']}")
+        # Let the flasher reject bad engines, write modes and block sizes up front
+        FlasherInterface(entry["port"], **merged)
+        jobs.append((entry["port"], options))
+
+    ports = [port for port, _ in jobs]
+    if len(set(ports)) != len(ports):
+        raise ValueError("Manifest: a port is listed more than once")
+    # Each port is limited by its own serial link, so by default they all flash at once
+    if max_workers is None:
+        max_workers = len(jobs)
+    station_settings["max_workers"] = _parse_count(max_workers, "max_workers")
+    return station_settings, defaults, jobs
+
+
+def _result(job, station):
+    options = dict(station.flasher_options, firmware_path=station.firmware_path)
+    options.update(job.options)
+    return {
+        "port": job.port,
+        "success": job.state == DONE,
+        "state": job.state,
+        "attempts": job.attempts,
+        "duration": round(job.duration, 3),
+        "error": job.error,
+        "report": job.report,
+        "firmware": options["firmware_path"],
+        "offset": options.get("flash_offset", 0),
+        "timestamp": time.time(),
+    }
+
+
+def run_batch(manifest_path, results=None, events_path=None, verbose=False):
+    """Flashes everything in the manifest, writing one JSON line per port to results. Returns the exit code."""
+    station_settings, defaults, jobs = load_manifest(manifest_path)
+    results = results or sys.stdout
+    lock = threading.Lock()
+
+    def on_job(job):
+        # Every job ends in exactly one of these, cancelled ones included after Ctrl-C
+        if job.state in (DONE, FAILED, CANCELLED):
+            with lock:
+                results.write(json.dumps(_result(job, station)) + "\n")
+                results.flush()
+                print(f"{job.port}: {job.state} after {job.attempts} attempt(s), {job.duration:.1f}s",
+                      file=sys.stderr)
+
+    def log(event):
+        sys.stderr.write(f"[{event.port}] {event.text}")
+
+    station = FlashStation(
+        defaults.pop("firmware_path", None),
+        baud_rate=defaults.pop("baud_rate", 460800),
+        chip_type=defaults.pop("chip_type", "auto"),
+        engine=defaults.pop("engine", "api"),
+        callback=on_job,
+        **station_settings,
+        **defaults
+    )
+    if events_path:
+        station.events.subscribe(JsonLinesSink(events_path))
+    if verbose:
+        station.events.subscribe(log, LogEvent)
+
+    for port, options in jobs:
+        station.submit(port, **options)
+    try:
+        station.wait()
+    except KeyboardInterrupt:
+        print("Interrupted, waiting for running flashes to finish...", file=sys.stderr)
+        station.cancel()
+        station.wait()
+
+    summary = station.summary()
+    print(f"{summary['succeeded']}/{summary['total']} succeeded, {summary['failed']} failed, "
+          f"{summary['elapsed']:.1f}s, {summary['units_per_minute']:.1f} units/min", file=sys.stderr)
+    return 0 if summary["succeeded"] == summary["total"] else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="esp32-uploader --batch",
+        description="Flash the ports listed in a job manifest without the GUI.")
+    parser.add_argument("manifest", help="JSON job manifest")
+    parser.add_argument("--results", help="append JSON-lines results here instead of stdout")
+    parser.add_argument("--events", help="append every flashing event as JSON lines to this file")
+    parser.add_argument("--verbose", action="store_true", help="stream esptool output to stderr")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.results:
+            with open(args.results, "a", encoding="utf-8") as results:
+                return run_batch(args.manifest, results, args.events, args.verbose)
+        return run_batch(args.manifest, None, args.events, args.verbose)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
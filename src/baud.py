@@ -0,0 +1,133 @@
+import json
+import os
+import re
+import threading
+import time
+
+import serial
+import serial.tools.list_ports
+from esptool.util import FatalError, NotImplementedInROMError
+
+from src.paths import user_config_dir
+
+# Rates tried by auto-baud, slowest first. 115200 is the ROM rate every chip syncs at.
+BAUD_LADDER = (115200, 230400, 460800, 921600, 1500000, 2000000)
+# Bytes read back (MD5-checked by the stub) to prove a rate works
+PROBE_SIZE = 0x4000
+# esptool errors that mean bytes were lost or mangled on the wire, i.e. the link is
+# not coping with the current rate. Anything else (wrong chip, flash failures, a
+# board that was unplugged) would fail the same way at any rate. So would inflate
+# errors: blocks are checksummed on the wire, so those mean bad data was sent.
+_LINK_ERROR_MESSAGES = re.compile(
+    r"No serial data received|Serial data stream stopped|Packet content transfer stopped"
+    r"|serial noise or corruption|Corrupt data|Digest mismatch|Expected digest"
+    r"|Response doesn't match request|Checksum error|Bad data checksum|Bad data length"
+    r"|Not enough data|Too much data"
+)
+
+
+class LinkCheckError(FatalError):
+    """probe_baud couldn't bring the link back to baud, the last rate that passed."""
+
+    def __init__(self, message, baud):
+        super().__init__(message)
+        self.baud = baud
+
+
+def is_link_error(error):
+    """True if error is a transport or timeout failure that a slower baud rate might avoid."""
+    if isinstance(error, (serial.SerialTimeoutException, LinkCheckError)):
+        return True
+    return isinstance(error, FatalError) and bool(_LINK_ERROR_MESSAGES.search(str(error)))
+
+
+def default_profile_path():
+    return os.path.join(user_config_dir(), "baud_profiles.json")
+
+
+def adapter_key(port):
+    """Identifies the USB-UART adapter behind port as "VID:PID:serial", or None if unknown."""
+    for info in serial.tools.list_ports.comports():
+        if info.device == port and info.vid is not None:
+            return f"{info.vid:04X}:{info.pid:04X}:{info.serial_number or ''}"
+    return None
+
+
+def lower_baud(baud):
+    """Next rate down the ladder, or None if baud is already the slowest."""
+    lower = [rate for rate in BAUD_LADDER if rate < baud]
+    return lower[-1] if lower else None
+
+
+class BaudProfileStore:
+    """Persistent map of adapter key -> fastest baud rate proven to work with it."""
+
+    def __init__(self, path=None):
+        self.path = path or default_profile_path()
+        self._lock = threading.Lock()
+        self._profiles = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._profiles, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Returns the stored rate for key, or None."""
+        if key is None:
+            return None
+        with self._lock:
+            profile = self._profiles.get(key)
+        return profile["baud"] if profile else None
+
+    def record(self, key, baud):
+        """Stores baud as the rate to start at for this adapter."""
+        if key is None:
+            return
+        with self._lock:
+            self._profiles[key] = {"baud": baud, "updated": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self._save()
+
+
+def probe_baud(esp, max_baud, log):
+    """
+    Steps the stub's baud rate up the ladder while an MD5-checked flash read succeeds.
+
+    Returns the fastest working rate. The connection is left at that rate; if it
+    cannot be brought back after a failed step, LinkCheckError is raised with that
+    rate so the caller can reconnect at it.
+    """
+    good = esp._port.baudrate
+    for rate in BAUD_LADDER:
+        if rate <= good or rate > max_baud:
+            continue
+        try:
+            esp.change_baud(rate)
+            # The stub sends an MD5 of the data after a read, read_flash checks it
+            esp.read_flash(0, PROBE_SIZE)
+        except NotImplementedInROMError:
+            log(f"Loader can't change baud rate, staying at {good}.\n")
+            break
+        except (serial.SerialException, OSError, FatalError) as e:
+            log(f"{rate} baud failed the link check ({e}), falling back to {good}.\n")
+            try:
+                esp.change_baud(good)
+                esp.read_flash(0, PROBE_SIZE)
+            except (serial.SerialException, OSError, FatalError) as e:
+                raise LinkCheckError(f"Link lost after the check at {rate} baud ({e})", good)
+            break
+        good = rate
+        log(f"Link check passed at {rate} baud.\n")
+    return good
@@ -0,0 +1,195 @@
+import json
+import re
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# Flashing phases, in the order they normally happen
+CONNECT = "connect"
+STUB = "stub"
+COMPARE = "compare"
+ERASE = "erase"
+WRITE = "write"
+VERIFY = "verify"
+RESET = "reset"
+PHASES = (CONNECT, STUB, COMPARE, ERASE, WRITE, VERIFY, RESET)
+
+
+class LogEvent(NamedTuple):
+    """A chunk of human readable log output."""
+    port: str
+    text: str
+    timestamp: float
+
+
+class PhaseEvent(NamedTuple):
+    """The flasher moved on to a new phase."""
+    port: str
+    phase: str
+    timestamp: float
+
+
+class ProgressEvent(NamedTuple):
+    """Write progress of one region. Byte counts are bytes sent over the wire."""
+    port: str
+    address: int
+    written: int
+    total: int
+    throughput: float  # bytes per second, smoothed
+    eta: Optional[float]  # seconds left for this region, None until known
+    timestamp: float
+
+    @property
+    def percent(self):
+        return 100.0 * self.written / self.total if self.total else 100.0
+
+
+class ResultEvent(NamedTuple):
+    """Final outcome of a flash."""
+    port: str
+    success: bool
+    message: str
+    elapsed: float
+    report: Optional[dict]
+    timestamp: float
+
+
+class EventStream:
+    """
+    Fan-out of flasher events to any number of subscribers.
+
+    Subscribers are plain callables, optionally limited to some event types,
+    and are called on the flashing thread in the order they subscribed.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, *event_types):
+        """Calls callback(event) for every event, or only for the given event types."""
+        with self._lock:
+            self._subscribers = self._subscribers + [(callback, event_types)]
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[0] is not callback]
+
+    def publish(self, event):
+        for callback, event_types in self._subscribers:
+            if not event_types or isinstance(event, event_types):
+                callback(event)
+
+
+class ProgressTracker:
+    """Turns raw (address, written, total) samples into ProgressEvents with throughput and ETA."""
+
+    SMOOTHING = 0.3
+
+    def __init__(self, port):
+        self.port = port
+        self._total = None
+        self._last = None
+        self.throughput = 0.0
+
+    def update(self, address, written, total):
+        now = time.monotonic()
+        # esptool reports the address it's writing at, which moves with every
+        # sample, so a region is told apart by its size and by written restarting
+        if total != self._total or self._last is None or written < self._last[0]:
+            # New region, start measuring again
+            self._total = total
+            self._last = (written, now)
+            self.throughput = 0.0
+        else:
+            last_written, last_time = self._last
+            if now > last_time and written > last_written:
+                rate = (written - last_written) / (now - last_time)
+                self.throughput = rate if not self.throughput else (
+                    self.SMOOTHING * rate + (1 - self.SMOOTHING) * self.throughput)
+                self._last = (written, now)
+
+        eta = (total - written) / self.throughput if self.throughput else None
+        return ProgressEvent(self.port, address, written, total, self.throughput, eta, time.time())
+
+
+# esptool output lines that mark the start of a phase
+_PHASE_PATTERNS = (
+    (CONNECT, re.compile(r"^Connecting")),
+    (STUB, re.compile(r"^Uploading stub")),
+    (ERASE, re.compile(r"^(Flash will be erased|Erasing)")),
+    (WRITE, re.compile(r"^(Compressed \d+ bytes|Writing at)")),
+    (VERIFY, re.compile(r"^Wrote \d+ bytes")),
+    (RESET, re.compile(r"^(Hard resetting|Soft resetting|Staying in)")),
+)
+_PROGRESS_PATTERN = re.compile(r"Writing at (0x[0-9a-fA-F]+).*?(\d+)/(\d+) bytes")
+_ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+
+class OutputParser:
+    """
+    Incremental parser for esptool's console output, used by the subprocess engine.
+
+    Feed it chunks of text as they arrive; it splits them on \\r and \\n, strips ANSI
+    codes and calls on_phase(phase) and on_progress(address, written, total) as it
+    recognises things. Every other line goes to on_line(line, terminator).
+    """
+
+    def __init__(self, on_line, on_phase, on_progress):
+        self.on_line = on_line
+        self.on_phase = on_phase
+        self.on_progress = on_progress
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        parts = re.split(r"(\r\n|\r|\n)", self._buffer)
+        # The last part has no terminator yet, keep it for the next chunk
+        self._buffer = parts.pop()
+        for line, terminator in zip(parts[0::2], parts[1::2]):
+            self._handle(line, terminator)
+
+    def close(self):
+        if self._buffer:
+            self._handle(self._buffer, "")
+            self._buffer = ""
+
+    def _handle(self, line, terminator):
+        clean_line = _ANSI_ESCAPE.sub('', line)
+        stripped = clean_line.strip()
+
+        for phase, pattern in _PHASE_PATTERNS:
+            if pattern.search(stripped):
+                self.on_phase(phase)
+                break
+
+        match = _PROGRESS_PATTERN.search(stripped)
+        if match:
+            # Progress bar redraws are reported as data, not as log lines
+            self.on_progress(int(match.group(1), 16), int(match.group(2)), int(match.group(3)))
+        else:
+            self.on_line(clean_line, "\n" if terminator.endswith("\n") else terminator)
+
+
+def _event_to_dict(event):
+    data = {"event": type(event).__name__}
+    data.update(event._asdict())
+    return data
+
+
+class JsonLinesSink:
+    """Subscriber that appends every event it receives to a JSON-lines file."""
+
+    def __init__(self, path, include_log=False):
+        self.path = path
+        self.include_log = include_log
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if isinstance(event, LogEvent) and not self.include_log:
+            return
+        line = json.dumps(_event_to_dict(event))
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
@@ -1,21 +1,124 @@
 import sys
+import codecs
+import hashlib
 import threading
 import serial.tools.list_ports
+from serial import SerialException
 import esptool
 import time
-import re
-from io import StringIO
+import struct
+
+from esptool.bin_image import LoadFirmwareImage
+from esptool.cmds import attach_flash, detect_chip, detect_flash_size, reset_chip, run_stub, write_flash
+from esptool.loader import (
+    DEFAULT_CONNECT_ATTEMPTS, DEFAULT_TIMEOUT, ERASE_WRITE_TIMEOUT_PER_MB, ESPLoader, timeout_per_mb,
+)
+from esptool.logger import EsptoolLogger, log as esptool_log
+from esptool.targets import CHIP_DEFS
+from esptool.util import FatalError, NotImplementedInROMError, flash_size_bytes
+
+from src.baud import (
+    BAUD_LADDER, BaudProfileStore, LinkCheckError, adapter_key, is_link_error, lower_baud, probe_baud,
+)
+from src.events import (
+    COMPARE, CONNECT, ERASE, RESET, STUB, VERIFY, WRITE,
+    EventStream, LogEvent, OutputParser, PhaseEvent, ProgressEvent, ProgressTracker, ResultEvent,
+)
+from src.regions import FLASH_SECTOR_SIZE, diff_regions, sparse_regions
+
+ENGINES = ("api", "subprocess")
+WRITE_MODES = ("full", "diff", "sparse")
+DEFAULT_DIFF_BLOCK_SIZE = 0x10000
+
+# Per-thread destination for esptool's global logger, so that several
+# in-process flashes can run side by side without mixing their output
+_log_sink = threading.local()
+
+
+class _EsptoolLogAdapter(EsptoolLogger):
+    """Routes esptool's logger output to the FlasherInterface running on this thread."""
+
+    def print(self, *args, **kwargs):
+        flasher = getattr(_log_sink, "flasher", None)
+        if flasher is None:
+            return super().print(*args, **kwargs)
+        sep = kwargs.get("sep", " ")
+        end = kwargs.get("end", "\n")
+        flasher.log(sep.join(map(str, args)) + end)
+
+    def progress_bar(self, cur_iter, total_iters, prefix="", suffix="", bar_length=30):
+        flasher = getattr(_log_sink, "flasher", None)
+        if flasher is None:
+            return super().progress_bar(cur_iter, total_iters, prefix, suffix, bar_length)
+        # prefix looks like "Writing at 0x00010000 "
+        try:
+            address = int(prefix.split()[-1], 16)
+        except (IndexError, ValueError):
+            address = 0
+        flasher.report_progress(address, cur_iter, total_iters)
+
+
+def _install_log_adapter():
+    """Swap esptool's singleton logger for our thread-aware adapter (once)."""
+    if not isinstance(esptool_log, _EsptoolLogAdapter):
+        # EsptoolLogger is a singleton; set_logger() only rebinds its class
+        esptool_log.set_logger(object.__new__(_EsptoolLogAdapter))
+        # No ANSI colours or collapsing stages, we are not writing to a terminal
+        esptool_log.set_verbosity("verbose")
+
 
 class FlasherInterface:
-    def __init__(self, port, firmware_path, baud_rate=460800, chip_type="auto", callback=None):
+    def __init__(self, port, firmware_path, baud_rate=460800, chip_type="auto", callback=None,
+                 engine="api", progress_callback=None, reset_delay=0,
+                 write_mode="full", diff_block_size=DEFAULT_DIFF_BLOCK_SIZE, payload_cache=None,
+                 events=None, baud_profiles=None, flash_offset=0x0):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown flashing engine: {engine}")
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode: {write_mode}")
+        if diff_block_size <= 0 or diff_block_size % FLASH_SECTOR_SIZE:
+            raise ValueError(f"Diff block size must be a multiple of {FLASH_SECTOR_SIZE:#x} bytes")
+
         self.port = port
         self.firmware_path = firmware_path
+        # Flash address the image is written to; merged images start at 0x0
+        self.flash_offset = flash_offset
+        # An int, or "auto" to find the fastest rate the adapter handles
         self.baud_rate = baud_rate
+        self.auto_baud = baud_rate == "auto"
+        if self.auto_baud and baud_profiles is None:
+            baud_profiles = BaudProfileStore()
+        self.baud_profiles = baud_profiles
+        # Rate the current connection actually runs at, once it has been switched
+        self.active_baud = None
+        self._forced_baud = None
         self.chip_type = chip_type
         self.callback = callback
+        self.engine = engine
+        # Typed event stream (phases, progress, log, result) of this flasher only. Events
+        # are forwarded to a shared stream if given, so its subscribers see every port
+        self.events = EventStream()
+        if events is not None:
+            self.events.subscribe(events.publish)
+        if progress_callback:
+            self.events.subscribe(progress_callback, ProgressEvent)
+        # Seconds to wait before resetting the board into the bootloader
+        self.reset_delay = reset_delay
+        # "full" writes the whole image, "diff" only the blocks that differ from flash,
+        # "sparse" only the sectors that aren't 0xFF padding
+        self.write_mode = write_mode
+        self.diff_block_size = diff_block_size
+        # Optional PayloadCache so identical regions are only compressed once
+        self.payload_cache = payload_cache
+        # Bytes written/skipped/erased by the last flash, filled in by the api engine
+        self.write_report = None
 
         self.is_flashing = False
         self.cancel_requested = False
+        self.last_error = None
+        self.phase = None
+        self._tracker = ProgressTracker(port)
+        self._last_logged_percent = -1
 
     def list_ports(self):
         """Returns a list of available serial ports."""
@@ -26,113 +129,468 @@ class FlasherInterface:
         """Send log message to callback."""
         if self.callback:
             self.callback(message)
+        self.events.publish(LogEvent(self.port, message, time.time()))
+
+    def set_phase(self, phase):
+        """Announce the start of a flashing phase (repeats of the current phase are ignored)."""
+        if phase == self.phase:
+            return
+        self.phase = phase
+        self.events.publish(PhaseEvent(self.port, phase, time.time()))
+
+    def report_progress(self, address, written, total):
+        """Publish write progress and log it every 10%."""
+        progress = self._tracker.update(address, written, total)
+        if written < total:
+            # Back to writing when the next region starts after one was verified
+            self.set_phase(WRITE)
+        self.events.publish(progress)
+
+        percent = int(progress.percent) // 10 * 10
+        if percent != self._last_logged_percent:
+            self._last_logged_percent = percent
+            # \r lets consoles redraw the line in place until the region is done
+            self.log(f"Writing at {address:#010x}... {percent}% ({written}/{total} bytes)"
+                     + ("\n" if percent == 100 else "\r"))
+            if percent == 100:
+                self.set_phase(VERIFY)
+                self.log("\nVerifying upload (this may take a moment)...\n")
 
     def flash_firmware(self):
-        """Runs the esptool flashing process in a separate subprocess."""
+        """Runs the flashing process in a background thread."""
         self.is_flashing = True
         self.cancel_requested = False
-        
-        def run():
+
+        thread = threading.Thread(target=self.flash, daemon=True)
+        thread.start()
+
+    def flash(self):
+        """Flashes the firmware on the calling thread. Returns True on success."""
+        self.is_flashing = True
+        self.last_error = None
+        self.phase = None
+        self._forced_baud = None
+        self._last_logged_percent = -1
+        started = time.monotonic()
+        success = False
+        try:
+            self.log(f"Starting flash on {self.port} at {self.baud_rate} baud...\n")
+
+            if self.reset_delay:
+                self.log(f"Waiting {self.reset_delay} seconds before reset...\n")
+                time.sleep(self.reset_delay)
+
+            if self.engine == "subprocess":
+                if self.write_mode != "full":
+                    self.log(f"The subprocess engine can't do {self.write_mode} writes, writing the full image.\n")
+                success = self._flash_with_subprocess()
+            else:
+                success = self._flash_with_api()
+            return success
+        except Exception as e:
+            self.last_error = str(e)
+            self.log(f"Unexpected error: {str(e)}")
+            return False
+        finally:
+            self.is_flashing = False
+            self.events.publish(ResultEvent(
+                self.port, success, "ok" if success else (self.last_error or "failed"),
+                time.monotonic() - started, self.write_report, time.time()))
+
+    def _target_baud(self):
+        """The rate to switch to after connecting, or None if auto-baud has to probe for it."""
+        if not self.auto_baud:
+            return self.baud_rate
+        if self._forced_baud:
+            return self._forced_baud
+        return self.baud_profiles.get(adapter_key(self.port))
+
+    def _connect(self):
+        """Connects to the chip, uploads the stub and switches to the requested baud rate."""
+        target_baud = self._target_baud()
+        # Always sync at the ROM baud rate, then speed up once the stub is running
+        initial_baud = min(ESPLoader.ESP_ROM_BAUD, target_baud or ESPLoader.ESP_ROM_BAUD)
+
+        self.set_phase(CONNECT)
+        if self.chip_type and self.chip_type != "auto":
+            esp = CHIP_DEFS[self.chip_type](self.port, initial_baud)
+            esp.connect("default-reset")
+        else:
+            esp = detect_chip(self.port, initial_baud, "default-reset")
+
+        self.log(f"Connected to {esp.CHIP_NAME}\n")
+        self.set_phase(STUB)
+        esp = run_stub(esp)
+        attach_flash(esp)
+
+        if target_baud is None:
+            self.log("Probing for the fastest reliable baud rate...\n")
+            best = probe_baud(esp, BAUD_LADDER[-1], self.log)
+            self.baud_profiles.record(adapter_key(self.port), best)
+        elif target_baud > initial_baud:
+            try:
+                esp.change_baud(target_baud)
+            except NotImplementedInROMError:
+                self.log(f"ROM doesn't support changing baud rate, keeping {initial_baud}.\n")
+
+        self.active_baud = esp._port.baudrate
+        if self.auto_baud:
+            self.log(f"Using {self.active_baud} baud.\n")
+        return esp
+
+    def _plan_regions(self, esp, image):
+        """
+        Returns (write_regions, erase_regions) for the selected write mode.
+
+        write_regions are (address, data) tuples for write_flash, erase_regions are
+        (address, size) ranges that only need erasing.
+        """
+        erase_regions = []
+        if self.write_mode == "diff":
+            self.set_phase(COMPARE)
+            self.log(f"Comparing image with flash in {self.diff_block_size // 1024} KB blocks...\n")
+            regions, skipped = diff_regions(image, self.diff_block_size, esp.flash_md5sum,
+                                            base=self.flash_offset)
+        elif self.write_mode == "sparse":
+            regions, erase_regions, skipped = sparse_regions(image)
+            regions = [(address + self.flash_offset, data) for address, data in regions]
+            erase_regions = [(address + self.flash_offset, size) for address, size in erase_regions]
+        else:
+            regions, skipped = [(self.flash_offset, image)], 0
+
+        written = sum(len(data) for _, data in regions)
+        erased = sum(size for _, size in erase_regions)
+        self.write_report = {
+            "mode": self.write_mode,
+            "bytes_written": written,
+            "bytes_skipped": skipped,
+            "bytes_erased": erased,
+        }
+        if self.write_mode == "diff":
+            self.log(f"{len(regions)} region(s) differ: writing {written} bytes, skipping {skipped} bytes.\n")
+        elif self.write_mode == "sparse":
+            self.log(f"Sparse image: writing {written} bytes in {len(regions)} segment(s), "
+                     f"erasing {erased} bytes, trimming {skipped} bytes of padding.\n")
+        return regions, erase_regions
+
+    def _can_use_cache(self, esp):
+        """Cached writes cover the plain stub path; anything with security features goes through write_flash."""
+        return (
+            self.payload_cache is not None
+            and esp.IS_STUB
+            and not esp.secure_download_mode
+            and not esp.get_secure_boot_enabled()
+            and not esp.get_flash_encryption_enabled()
+        )
+
+    def _check_regions(self, esp, regions):
+        """
+        The safety checks write_flash runs before writing, for the cached path.
+
+        Refuses images for another chip or a newer chip revision, and regions
+        that are empty or run past the end of flash. Returns the flash size in
+        bytes (None if it can't be detected).
+        """
+        for _, data in regions:
+            if not data:
+                raise FatalError("Input bytes are empty.")
             try:
-                self.log(f"Starting flash on {self.port} at {self.baud_rate} baud...\n")
-                
-                # Wait 3 seconds before performing reset
-                self.log("Waiting 3 seconds before reset...\n")
-                time.sleep(3)
-                
-                import subprocess
-                
-                # Build command for subprocess
-                if getattr(sys, 'frozen', False):
-                    # We are running as a frozen executable (PyInstaller)
-                    # Use our special wrapper flag to invoke esptool within our own process exe
-                    # but as a separate subprocess
-                    cmd = [sys.executable, '--esptool-wrapper']
-                else:
-                    # Running from source
-                    cmd = [sys.executable, '-m', 'esptool']
-
-                cmd.extend([
-                    '--port', self.port,
-                    '--baud', str(self.baud_rate),
-                    '--before', 'default-reset',
-                    '--after', 'hard-reset',
-                ])
-                
-                # Add chip type if specified
-                if self.chip_type and self.chip_type != "auto":
-                    cmd.extend(['--chip', self.chip_type])
-                
-                cmd.extend([
-                    'write-flash',
-                    '-z',
-                    '--flash-mode', 'keep',
-                    '--flash-freq', 'keep',
-                    '--flash-size', 'keep',
-                    '0x0', self.firmware_path
-                ])
-                
-                # Log the command for debugging
-                self.log(f"Running command: {' '.join(cmd)}\n")
-                
+                image = LoadFirmwareImage(esp.CHIP_NAME, data)
+            except (FatalError, struct.error, RuntimeError):
+                continue
+            if image.chip_id != esp.IMAGE_CHIP_ID:
+                raise FatalError(f"Input does not contain an {esp.CHIP_NAME} image.")
+            self._check_revision(esp, image)
+
+        if esp.get_encrypted_download_disabled() and esp.get_flash_encryption_enabled():
+            raise FatalError("Detected flash encryption enabled and download manual encrypt disabled. "
+                             "Flashing plaintext binary may brick your device!")
+
+        flash_end = flash_size_bytes(detect_flash_size(esp))
+        if flash_end is not None:
+            for address, data in regions:
+                if address + len(data) > flash_end:
+                    raise FatalError(f"Input image (length {len(data)}) at offset {address:#010x} "
+                                     f"will not fit in {flash_end} bytes of flash.")
+        return flash_end
+
+    def _check_revision(self, esp, image):
+        """Raises if the chip is older than the image's minimum revision (same rules as write_flash)."""
+        if image.max_rev_full == 0:
+            # Image has no min/max_rev_full fields
+            use_rev_full = False
+        elif image.max_rev_full == 65535:
+            use_rev_full = not (image.min_rev_full == 0 and image.min_rev != 0)
+        else:
+            use_rev_full = True
+
+        if use_rev_full:
+            rev = esp.get_chip_revision()
+            if rev < image.min_rev_full or rev > image.max_rev_full:
+                newest = ("max rev not set" if image.max_rev_full == 65535
+                          else f"v{image.max_rev_full // 100}.{image.max_rev_full % 100}")
+                raise FatalError(
+                    f"Image requires chip revision in range [v{image.min_rev_full // 100}."
+                    f"{image.min_rev_full % 100} - {newest}] (this chip is revision v{rev // 100}.{rev % 100}).")
+        else:
+            # min_rev is the minor version on the ESP32-C3 and the major version elsewhere
+            if esp.CHIP_NAME == "ESP32-C3":
+                rev = esp.get_minor_chip_version()
+            else:
+                rev = esp.get_major_chip_version()
+            if rev < image.min_rev:
+                raise FatalError(f"Image requires chip revision {image.min_rev} or higher "
+                                 f"(this chip is revision {rev}).")
+
+    def _write_cached(self, esp, regions):
+        """
+        Writes regions with pre-compressed payloads, following write_flash's stub path.
+
+        Like write_flash, a region whose write loses the serial connection is
+        retried after reconnecting and reloading the stub. Returns the loader to
+        use from then on, which is a new object after a reconnect.
+        """
+        flash_end = self._check_regions(esp, regions)
+        if flash_end is not None:
+            esp.flash_set_parameters(flash_end)
+
+        self.set_phase(WRITE)
+        for address, data in regions:
+            payload = self.payload_cache.get(data)
+            compsize = len(payload.compressed)
+            self.log(f"Writing {payload.size} bytes ({compsize} compressed) at {address:#010x}...\n")
+
+            for attempt in range(1, esp.WRITE_FLASH_ATTEMPTS + 1):
                 try:
-                    # Run esptool as subprocess
-                    process = subprocess.Popen(
-                        cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        bufsize=1
-                    )
-                    
-                    # Read output character by character to handle \r progress bars correctly
-                    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-                    verified_msg_shown = False
-                    current_line = []
-                    
-                    while True:
-                        char = process.stdout.read(1)
-                        if not char:
-                            break
-                        
-                        if char == '\r' or char == '\n':
-                            # Process the complete chunk/line
-                            line_str = ''.join(current_line)
-                            clean_line = ansi_escape.sub('', line_str)
-                            
-                            # Log it (add newline if it was a \r update to keep log readable if needed, 
-                            # or just pass it through. GUI log likely handles \n best)
-                            if char == '\r':
-                                # If it's a progress update, we might want to overwrite or just append
-                                # For simplicity in this text box, we'll just append
-                                pass 
-                            
-                            self.log(clean_line + ('\n' if char == '\n' else ''))
-                            
-                            # Check for 100% trigger
-                            if not verified_msg_shown and "100" in clean_line and "%" in clean_line:
-                                self.log("\nVerifying upload (this may take a moment)...\n")
-                                verified_msg_shown = True
-                            
-                            current_line = []
-                        else:
-                            current_line.append(char)
-                    
-                    process.wait()
-                    
-                    if process.returncode == 0:
-                        self.log("\nFlashing completed successfully!\n")
-                    else:
-                        self.log(f"\nError during flashing (exit code: {process.returncode})\n")
-                        
+                    timeout = self._send_payload(esp, address, payload)
+                    break
+                except SerialException:
+                    if attempt == esp.WRITE_FLASH_ATTEMPTS:
+                        raise
+                    self.log("\nLost connection, retrying...\n")
+                    esp = self._reconnect(esp, flash_end)
+            esp.flash_defl_finish(reboot=False, timeout=timeout)
+
+            flash_md5 = esp.flash_md5sum(address, payload.size)
+            if flash_md5 != payload.md5:
+                if flash_md5 == hashlib.md5(b"\xff" * payload.size).hexdigest():
+                    raise FatalError("Write failed, the written flash region is empty.")
+                raise FatalError("MD5 of file does not match data in flash!")
+            self.log("Hash of data verified.\n")
+        return esp
+
+    def _send_payload(self, esp, address, payload):
+        """Streams one compressed payload to the stub. Returns the timeout for the final block."""
+        compsize = len(payload.compressed)
+        esp.flash_defl_begin(payload.size, compsize, address)
+        timeout = DEFAULT_TIMEOUT
+        sent = 0
+        for seq, (block, length) in enumerate(payload.blocks(esp.FLASH_WRITE_SIZE)):
+            self.report_progress(address, sent, compsize)
+            esp.flash_defl_block(block, seq, timeout=timeout)
+            # The stub ACKs a block on receipt and writes it while the next one arrives
+            timeout = max(DEFAULT_TIMEOUT, timeout_per_mb(ERASE_WRITE_TIMEOUT_PER_MB, length))
+            sent += len(block)
+        self.report_progress(address, sent, compsize)
+        return timeout
+
+    def _reconnect(self, esp, flash_end):
+        """Reopens the port after it dropped, resyncs with the chip and reloads the stub, as write_flash does."""
+        baud = esp._port.baudrate
+        esp._port.close()
+        self.log("Waiting for the chip to reconnect...\n")
+        for attempt in range(1, DEFAULT_CONNECT_ATTEMPTS + 1):
+            try:
+                time.sleep(1)
+                esp._port.open()
+                # The chip was reset, so it listens at the ROM rate again
+                esp._port.baudrate = ESPLoader.ESP_ROM_BAUD
+                esp.connect()
+                break
+            except SerialException:
+                esp._port.close()
+                if attempt == DEFAULT_CONNECT_ATTEMPTS:
+                    raise
+        # Same as write_flash: the reset dropped the stub, so bypass the check for a running one
+        esp.IS_STUB = False
+        esp = esp.run_stub()
+        attach_flash(esp)
+        if flash_end is not None:
+            esp.flash_set_parameters(flash_end)
+        if baud > ESPLoader.ESP_ROM_BAUD:
+            esp.change_baud(baud)
+        return esp
+
+    def _flash_with_api(self):
+        """Flashes in-process through esptool's Python API."""
+        _install_log_adapter()
+        _log_sink.flasher = self
+        try:
+            with open(self.firmware_path, "rb") as f:
+                image = f.read()
+
+            while True:
+                try:
+                    self._flash_image(image)
+                    break
                 except Exception as e:
-                    self.log(f"\nError during flashing: {str(e)}\n")
-                finally:
-                    self.is_flashing = False
-                    
-            except Exception as e:
-                self.log(f"Unexpected error: {str(e)}")
-                self.is_flashing = False
-
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+                    fallback = self._fallback_baud(e)
+                    if fallback is None:
+                        raise
+                    self.log(f"\nLink error ({e}), retrying at {fallback} baud...\n")
+
+            if self._forced_baud:
+                # The slower rate proved itself, start there next time
+                self.baud_profiles.record(adapter_key(self.port), self._forced_baud)
+            self.log("\nFlashing completed successfully!\n")
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            self.log(f"\nError during flashing: {str(e)}\n")
+            return False
+        finally:
+            _log_sink.flasher = None
+
+    def _flash_image(self, image):
+        """One connect, write and reset cycle. Raises on any error."""
+        esp = None
+        self.active_baud = None
+        try:
+            esp = self._connect()
+            esp = self._write_image(esp, image)
+            self.set_phase(RESET)
+            reset_chip(esp, "hard-reset")
+        finally:
+            if esp is not None:
+                esp._port.close()
+
+    def _write_image(self, esp, image):
+        """
+        Erases and writes image at flash_offset over an open connection, as the write mode says.
+
+        Returns the loader to use afterwards; it is a new one if the write had to reconnect.
+        """
+        regions, erase_regions = self._plan_regions(esp, image)
+        if erase_regions:
+            self.set_phase(ERASE)
+        for address, size in erase_regions:
+            if esp.IS_STUB:
+                self.log(f"Erasing {size} bytes at {address:#010x}...\n")
+                esp.erase_region(address, size)
+            else:
+                # The ROM loader can't erase on its own, send the padding instead
+                regions.append((address, b"\xff" * size))
+        regions.sort()
+        if regions and self._can_use_cache(esp):
+            esp = self._write_cached(esp, regions)
+        elif regions:
+            self.set_phase(WRITE)
+            write_flash(
+                esp,
+                regions,
+                flash_freq="keep",
+                flash_mode="keep",
+                flash_size="keep",
+                compress=True,
+            )
+        else:
+            self.log("Flash already matches the image, nothing to write.\n")
+        return esp
+
+    def _fallback_baud(self, error):
+        """
+        With auto-baud, picks a slower rate after a link error.
+
+        The rate is only used for the retries of this flash; it is stored for the
+        adapter once a retry at it succeeds. Returns None when the error should not
+        be retried.
+        """
+        if not self.auto_baud or not is_link_error(error):
+            return None
+        if isinstance(error, LinkCheckError):
+            # Probing lost the link, go straight to the last rate that passed
+            fallback = error.baud
+        elif self.active_baud is None:
+            return None
+        else:
+            fallback = lower_baud(self.active_baud)
+        if fallback is None or fallback == self._forced_baud:
+            return None
+        self._forced_baud = fallback
+        return fallback
+
+    def _flash_with_subprocess(self):
+        """Flashes by running esptool in a separate process (isolated fallback)."""
+        import subprocess
+
+        # Build command for subprocess
+        if getattr(sys, 'frozen', False):
+            # We are running as a frozen executable (PyInstaller)
+            # Use our special wrapper flag to invoke esptool within our own process exe
+            # but as a separate subprocess
+            cmd = [sys.executable, '--esptool-wrapper']
+        else:
+            # Running from source
+            cmd = [sys.executable, '-m', 'esptool']
+
+        cmd.extend([
+            '--port', self.port,
+            '--baud', str(self._target_baud() or 460800),
+            '--before', 'default-reset',
+            '--after', 'hard-reset',
+        ])
+
+        # Add chip type if specified
+        if self.chip_type and self.chip_type != "auto":
+            cmd.extend(['--chip', self.chip_type])
+
+        cmd.extend([
+            'write-flash',
+            '-z',
+            '--flash-mode', 'keep',
+            '--flash-freq', 'keep',
+            '--flash-size', 'keep',
+            f'{self.flash_offset:#x}', self.firmware_path
+        ])
+
+        # Log the command for debugging
+        self.log(f"Running command: {' '.join(cmd)}\n")
+
+        try:
+            # Run esptool as subprocess, unbuffered binary pipe read in chunks
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=0
+            )
+
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            parser = OutputParser(
+                # \r-terminated redraws are logged without a line break
+                on_line=lambda line, terminator: self.log(line + ("\n" if terminator == "\n" else "")),
+                on_phase=self.set_phase,
+                on_progress=self.report_progress,
+            )
+
+            while True:
+                chunk = process.stdout.read(4096)
+                if not chunk:
+                    break
+                parser.feed(decoder.decode(chunk))
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+
+            process.wait()
+
+            if process.returncode == 0:
+                self.log("\nFlashing completed successfully!\n")
+                return True
+            self.last_error = f"esptool exited with code {process.returncode}"
+            self.log(f"\nError during flashing (exit code: {process.returncode})\n")
+            return False
+
+        except Exception as e:
+            self.last_error = str(e)
+            self.log(f"\nError during flashing: {str(e)}\n")
+            return False
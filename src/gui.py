@@ -1,31 +1,55 @@
 import customtkinter as ctk
 from tkinter import filedialog
+from src.baud import BaudProfileStore
+from src.events import PhaseEvent, ProgressEvent
 from src.flasher import FlasherInterface
+from src.log_console import LogConsole, default_log_path
+from src.payload_cache import PayloadCache, default_cache_dir
+from src.port_watcher import ESP_USB_IDS, AutoFlashPolicy, PortAttached, PortDetached, PortWatcher
+from src.regions import sparse_regions
+from src.station import DONE, FAILED, FlashStation
+from src.station_view import StationView
+import queue
 import threading
 import sys
-import queue
 
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
 
         self.title("ESP32 Firmware Flasher")
-        self.geometry("600x500")
+        # Wide enough for the port row (menus for port, baud and chip) at the default font
+        self.geometry("720x620")
+        self.minsize(720, 520)
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(3, weight=1)
+        self.grid_rowconfigure(5, weight=1)
 
 
         self.flasher = FlasherInterface(None, None)
+        self.station = None
         self.firmware_path = None
+        self.payload_cache = PayloadCache(cache_dir=default_cache_dir())
+        self.baud_profiles = BaudProfileStore()
+        # Latest progress/phase from the flashing thread, picked up by the GUI loop
+        self.latest_progress = None
+        self.current_phase = None
+        # Ports come and go on the watcher thread; the GUI loop applies the changes
+        self.port_watcher = PortWatcher()
+        self.port_events = queue.Queue()
+        # Only auto-flash ports behind a known ESP32 bridge, not every serial device
+        self.auto_flash_policy = AutoFlashPolicy(ESP_USB_IDS)
+        self.auto_flash_ports = {}
+        self._port_list = None
         
         # UI Elements
         self.create_widgets()
         
         # Port Auto-refresh
         self.refresh_ports()
+        self.port_watcher.events.subscribe(self.port_events.put, PortAttached, PortDetached)
+        self.port_watcher.start()
         
-        # Queue for thread-safe logging
-        self.log_queue = queue.Queue()
+        # Render queued log output and progress once per frame
         self.check_log_queue()
 
 
@@ -49,7 +73,7 @@ class App(ctk.CTk):
 
         self.baud_rates = ["300", "600", "1200", "2400", "4800", "9600", "14400", "19200", 
                           "28800", "38400", "57600", "115200", "230400", "460800", "921600", 
-                          "1000000", "2000000"]
+                          "1000000", "2000000", "auto"]
         self.baud_option_menu = ctk.CTkOptionMenu(self.port_frame, values=self.baud_rates, width=90)
         self.baud_option_menu.pack(side="left", padx=5)
         self.baud_option_menu.set("460800")
@@ -77,27 +101,100 @@ class App(ctk.CTk):
         self.browse_btn = ctk.CTkButton(self.file_frame, text="Browse", width=80, command=self.browse_file)
         self.browse_btn.pack(side="right", padx=10)
 
+        # 2b. Write options, on their own row so the file entry keeps its width
+        self.options_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.options_frame.grid(row=2, column=0, padx=20, pady=(0, 5), sticky="ew")
+
+        # Write mode: full image, only the blocks that changed or only non-padding sectors
+        self.mode_label = ctk.CTkLabel(self.options_frame, text="Mode:")
+        self.mode_label.pack(side="left", padx=(10, 5))
+
+        self.write_modes = ["full", "diff", "sparse"]
+        self.mode_option_menu = ctk.CTkOptionMenu(self.options_frame, values=self.write_modes, width=70,
+                                                 command=self.warm_payload_cache)
+        self.mode_option_menu.pack(side="left", padx=5)
+        self.mode_option_menu.set("full")
+
+        self.block_sizes = {"4 KB": 0x1000, "16 KB": 0x4000, "64 KB": 0x10000, "256 KB": 0x40000}
+        self.block_option_menu = ctk.CTkOptionMenu(self.options_frame, values=list(self.block_sizes), width=80)
+        self.block_option_menu.pack(side="left", padx=5)
+        self.block_option_menu.set("64 KB")
+
+        self.subprocess_checkbox = ctk.CTkCheckBox(self.options_frame, text="Isolated esptool process")
+        self.subprocess_checkbox.pack(side="right", padx=(10, 0))
+
+        # 2c. Station options
+        self.station_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.station_frame.grid(row=3, column=0, padx=20, pady=5, sticky="ew")
+
+        self.station_switch = ctk.CTkSwitch(self.station_frame, text="Station mode", command=self.toggle_station_mode)
+        self.station_switch.pack(side="left", padx=(10, 0))
+
+        # Ports flashed at once in station mode; "all" gives every selected port its own worker
+        self.workers_label = ctk.CTkLabel(self.station_frame, text="Parallel:")
+        self.workers_label.pack(side="left", padx=(20, 5))
+        self.workers_option_menu = ctk.CTkOptionMenu(self.station_frame, values=["all", "1", "2", "4", "8", "16"],
+                                                     width=60)
+        self.workers_option_menu.pack(side="left")
+        self.workers_option_menu.set("all")
+
+        self.auto_flash_checkbox = ctk.CTkCheckBox(self.station_frame, text="Auto-flash on plug-in")
+        self.auto_flash_checkbox.pack(side="right", padx=(10, 0))
+
         # 3. Action Buttons
         self.action_frame = ctk.CTkFrame(self, fg_color="transparent")
-        self.action_frame.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
+        self.action_frame.grid(row=4, column=0, padx=20, pady=10, sticky="ew")
 
-        
         self.flash_btn = ctk.CTkButton(self.action_frame, text="Flash Firmware", command=self.start_flashing, height=40)
         self.flash_btn.pack(fill="x")
 
         # 4. Console/Log
-        self.log_textbox = ctk.CTkTextbox(self, state="disabled")
-        self.log_textbox.grid(row=3, column=0, padx=20, pady=(10, 20), sticky="nsew")
+        self.log_textbox = LogConsole(self, log_path=default_log_path())
+        self.log_textbox.grid(row=5, column=0, padx=20, pady=(10, 10), sticky="nsew")
+
+        # 5. Progress
+        self.progress_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.progress_frame.grid(row=6, column=0, padx=20, pady=(0, 20), sticky="ew")
+
+        self.progress_bar = ctk.CTkProgressBar(self.progress_frame)
+        self.progress_bar.pack(side="left", expand=True, fill="x")
+        self.progress_bar.set(0)
+
+        self.progress_label = ctk.CTkLabel(self.progress_frame, text="", width=220, anchor="e")
+        self.progress_label.pack(side="right", padx=(10, 0))
+
+        # 4b. Station view, replaces the console while station mode is on
+        self.station_view = StationView(self)
 
 
     def refresh_ports(self):
-        ports = self.flasher.list_ports()
+        self.port_watcher.poll()
+        self.update_port_list()
+
+    def update_port_list(self):
+        """Rebuilds the port menu and station rows, but only if the set of ports changed."""
+        ports = self.port_watcher.devices()
+        if ports == self._port_list:
+            return
+        selected = self.port_option_menu.get()
+        self._port_list = ports
         if not ports:
             self.port_option_menu.configure(values=["No ports found"])
             self.port_option_menu.set("No ports found")
         else:
             self.port_option_menu.configure(values=ports)
-            self.port_option_menu.set(ports[0])
+            self.port_option_menu.set(selected if selected in ports else ports[0])
+        self.station_view.set_ports(ports)
+
+    def toggle_station_mode(self):
+        if self.station_switch.get():
+            self.log_textbox.grid_remove()
+            self.station_view.grid(row=5, column=0, padx=20, pady=(10, 20), sticky="nsew")
+            self.port_option_menu.configure(state="disabled")
+        else:
+            self.station_view.grid_remove()
+            self.log_textbox.grid()
+            self.port_option_menu.configure(state="normal")
 
     def browse_file(self):
         filename = filedialog.askopenfilename(filetypes=[("Merged Binaries", "*.merged.bin"), ("All Binary Files", "*.bin")])
@@ -105,21 +202,140 @@ class App(ctk.CTk):
             self.firmware_path = filename
             self.file_path_entry.delete(0, "end")
             self.file_path_entry.insert(0, filename)
+            self.warm_payload_cache()
+
+    def warm_payload_cache(self, *_):
+        """Start compressing the regions the selected mode will write, before Flash is clicked."""
+        if not self.firmware_path:
+            return
+        try:
+            with open(self.firmware_path, "rb") as f:
+                image = f.read()
+        except OSError:
+            return
+
+        mode = self.mode_option_menu.get()
+        if mode == "full":
+            self.payload_cache.warm([(0x0, image)])
+        elif mode == "sparse":
+            self.payload_cache.warm(sparse_regions(image)[0])
+        # diff regions depend on what is already on the device
 
     def log_callback(self, message):
-        self.log_queue.put(message)
+        self.log_textbox.write(message)
+
+    def on_flash_event(self, event):
+        # Called on the flashing thread, only hand the data over
+        if isinstance(event, ProgressEvent):
+            self.latest_progress = event
+        else:
+            self.current_phase = event.phase
+
+    def on_port_event(self, event):
+        """Runs on the GUI thread for every attach/detach the watcher saw."""
+        if isinstance(event, PortAttached):
+            self.log_callback(f"Port attached: {event.port.device} ({event.port.description})\n")
+            if self.auto_flash_checkbox.get():
+                self.auto_flash(event.port)
+        else:
+            self.log_callback(f"Port detached: {event.port.device}\n")
+            self.auto_flash_policy.detached(event.port)
+
+    def auto_flash(self, port):
+        if not self.firmware_path:
+            return
+        refused = self.auto_flash_policy.claim(port)
+        if refused:
+            self.log_callback(f"Not auto-flashing {port.device}: {refused} ({port.hwid})\n")
+            return
+        if self.station is None or (not self.station.is_running and self.station.jobs):
+            # Each plug-in session gets a fresh station so the summary covers it alone
+            self.create_station(self.get_max_workers(1))
+        if self.workers_option_menu.get() == "all":
+            # Boards keep arriving, so keep a worker for each one that is plugged in
+            self.station.max_workers = max(self.station.max_workers, len(self.port_watcher.devices()))
+        self.log_callback(f"Auto-flashing {port.device}\n")
+        self.auto_flash_ports[port.device] = port
+        was_running = self.station.is_running
+        self.station.submit(port.device)
+        if not was_running:
+            self.flash_btn.configure(state="disabled")
+            self.station_view.attach(self.station)
+            self.check_station()
+
+    def on_station_job(self, job):
+        """Station callback, called on a worker thread whenever a job changes state."""
+        if job.state in (DONE, FAILED):
+            # The station view may be hidden (auto-flash outside station mode), so the console gets the outcome
+            if job.state == DONE:
+                self.log_callback(f"{job.port}: flashed successfully in {job.duration:.1f}s\n")
+            else:
+                self.log_callback(f"{job.port}: failed after {job.attempts} attempt(s): {job.error or 'unknown error'}\n")
+            info = self.auto_flash_ports.pop(job.port, None)
+            if info is not None:
+                self.auto_flash_policy.finished(info, job.state == DONE)
 
     def check_log_queue(self):
-        while not self.log_queue.empty():
-            msg = self.log_queue.get()
-            self.log_textbox.configure(state="normal")
-            self.log_textbox.insert("end", msg)
-            self.log_textbox.see("end")
-            self.log_textbox.configure(state="disabled")
-        
+        events = []
+        while True:
+            try:
+                events.append(self.port_events.get_nowait())
+            except queue.Empty:
+                break
+        if events:
+            self.update_port_list()
+            for event in events:
+                self.on_port_event(event)
+
+        self.log_textbox.flush()
+        self.update_progress()
         self.after(100, self.check_log_queue)
 
+    def update_progress(self):
+        progress = self.latest_progress
+        if progress is None:
+            self.progress_label.configure(text=self.current_phase or "")
+            return
+
+        self.progress_bar.set(progress.percent / 100)
+        text = f"{self.current_phase or ''} {progress.percent:.0f}%"
+        if progress.throughput:
+            text += f"  {progress.throughput * 8 / 1000:.0f} kbit/s"
+        if progress.eta is not None:
+            text += f"  {progress.eta:.0f}s left"
+        self.progress_label.configure(text=text.strip())
+
+    def get_baud_rate(self):
+        if self.baud_option_menu.get() == "auto":
+            return "auto"
+        try:
+            return int(self.baud_option_menu.get())
+        except ValueError:
+            return 460800 # Default fallback
+
+    def get_engine(self):
+        return "subprocess" if self.subprocess_checkbox.get() else "api"
+
+    def get_max_workers(self, port_count):
+        """Station worker count for port_count ports. Flashing is bound by each serial link, not the CPU."""
+        value = self.workers_option_menu.get()
+        if value == "all":
+            return max(1, port_count)
+        return int(value)
+
+    def get_flasher_options(self):
+        return {
+            "write_mode": self.mode_option_menu.get(),
+            "diff_block_size": self.block_sizes[self.block_option_menu.get()],
+            "payload_cache": self.payload_cache,
+            "baud_profiles": self.baud_profiles,
+        }
+
     def start_flashing(self):
+        if self.station_switch.get():
+            self.start_station()
+            return
+
         port = self.port_option_menu.get()
         if port == "No ports found" or port == "Scanning...":
             self.log_callback("Error: No valid serial port selected.\n")
@@ -130,25 +346,23 @@ class App(ctk.CTk):
             return
 
         self.flash_btn.configure(state="disabled")
-        self.log_textbox.configure(state="normal")
-        self.log_textbox.delete("1.0", "end")
-        self.log_textbox.configure(state="disabled")
+        self.log_textbox.clear()
+        self.progress_bar.set(0)
+        self.latest_progress = None
+        self.current_phase = None
         
         # Initialize flasher with selected options
-        try:
-            baud_rate = int(self.baud_option_menu.get())
-        except ValueError:
-            baud_rate = 460800 # Default fallback
-            
         self.flasher = FlasherInterface(
             port, 
             self.firmware_path, 
-            baud_rate=baud_rate, 
+            baud_rate=self.get_baud_rate(), 
             chip_type=self.chip_option_menu.get(), 
-            callback=self.log_callback
+            callback=self.log_callback,
+            engine=self.get_engine(),
+            **self.get_flasher_options()
         )
+        self.flasher.events.subscribe(self.on_flash_event, ProgressEvent, PhaseEvent)
 
-        
         # Start in thread
         self.flasher.flash_firmware()
         
@@ -156,6 +370,39 @@ class App(ctk.CTk):
         self.monitor_thread = threading.Thread(target=self.wait_for_completion, daemon=True)
         self.monitor_thread.start()
 
+    def start_station(self):
+        if not self.firmware_path:
+            self.log_callback("Error: No firmware file selected.\n")
+            return
+
+        ports = self.station_view.selected_ports()
+        if not ports:
+            return
+
+        self.flash_btn.configure(state="disabled")
+        self.create_station(self.get_max_workers(len(ports)))
+        self.station.start(ports)
+        self.station_view.attach(self.station)
+        self.check_station()
+
+    def create_station(self, max_workers):
+        self.station = FlashStation(
+            self.firmware_path,
+            baud_rate=self.get_baud_rate(),
+            chip_type=self.chip_option_menu.get(),
+            engine=self.get_engine(),
+            max_workers=max_workers,
+            callback=self.on_station_job,
+            **self.get_flasher_options()
+        )
+
+    def check_station(self):
+        if self.station.is_running:
+            self.after(250, self.check_station)
+        else:
+            self.station_view.refresh()
+            self.flash_btn.configure(state="normal")
+
     def wait_for_completion(self):
         while self.flasher.is_flashing:
             time.sleep(0.1)
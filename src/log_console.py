@@ -0,0 +1,99 @@
+import os
+import queue
+
+import customtkinter as ctk
+
+from src.paths import user_cache_dir
+
+DEFAULT_MAX_LINES = 2000
+
+
+def default_log_path():
+    """File that lines scrolled out of the console are appended to."""
+    return os.path.join(user_cache_dir(), "console.log")
+
+
+def resolve_carriage_returns(text):
+    """
+    Applies \\r the way a progress bar expects: text after a \\r replaces the line.
+
+    Returns (visible_text, pending) where pending is True if text ends in a \\r, i.e.
+    whatever comes next should replace the last line.
+    """
+    lines = []
+    for line in text.split("\n"):
+        # The last non-empty redraw is what a terminal would be showing
+        parts = line.split("\r")
+        lines.append(next((part for part in reversed(parts) if part), ""))
+    return "\n".join(lines), text.endswith("\r")
+
+
+class LogConsole(ctk.CTkTextbox):
+    """
+    Read-only log textbox that is cheap to feed from worker threads.
+
+    write() only queues text. flush(), called once per GUI frame, joins everything
+    queued into a single insert, redraws \\r progress lines in place and keeps at
+    most max_lines lines; older lines are appended to log_path instead.
+    """
+
+    def __init__(self, master, max_lines=DEFAULT_MAX_LINES, log_path=None, **kwargs):
+        super().__init__(master, state="disabled", **kwargs)
+        self.max_lines = max_lines
+        self.log_path = log_path
+        self._queue = queue.Queue()
+        # The unterminated last line as written so far, so \r can replace it
+        self._tail = ""
+
+    def write(self, text):
+        """Queue text for the next flush. Safe to call from any thread."""
+        self._queue.put(text)
+
+    def flush(self):
+        """Render everything queued since the last flush in one textbox update."""
+        chunks = []
+        while True:
+            try:
+                chunks.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not chunks:
+            return
+
+        visible, pending = resolve_carriage_returns(self._tail + "".join(chunks))
+        last_line_start = visible.rfind("\n") + 1
+        self._tail = visible[last_line_start:] + ("\r" if pending else "")
+
+        self.configure(state="normal")
+        # Replace the current last line with its updated text plus everything new
+        self.delete("end-1c linestart", "end-1c")
+        self.insert("end-1c", visible)
+        self._rotate()
+        self.see("end")
+        self.configure(state="disabled")
+
+    def clear(self):
+        """Empty the console, keeping its contents in the log file."""
+        self.flush()
+        self.configure(state="normal")
+        self._archive(self.get("1.0", "end-1c"))
+        self.delete("1.0", "end")
+        self.configure(state="disabled")
+        self._tail = ""
+
+    def _rotate(self):
+        line_count = int(self.index("end-1c").split(".")[0])
+        excess = line_count - self.max_lines
+        if excess > 0:
+            self._archive(self.get("1.0", f"{excess + 1}.0"))
+            self.delete("1.0", f"{excess + 1}.0")
+
+    def _archive(self, text):
+        if not self.log_path or not text.strip():
+            return
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(text if text.endswith("\n") else text + "\n")
+        except OSError:
+            pass
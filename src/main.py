@@ -1,19 +1,38 @@
 import sys
-import customtkinter as ctk
-from src.gui import App
 
-if __name__ == "__main__":
-    # Check for subprocess wrapper mode (for frozen executable)
-    if len(sys.argv) > 1 and sys.argv[1] == '--esptool-wrapper':
-        import esptool
-        # Pass remaining arguments to esptool
-        # sys.argv[0] is executable path, sys.argv[1] is wrapper flag
-        # so we pass everything starting from index 2
-        esptool.main(sys.argv[2:])
-        sys.exit(0)
+# Only the mode that is asked for gets imported: the esptool wrapper and batch
+# mode must not pay for loading Tk, CustomTkinter and PIL.
+
+
+def run_gui():
+    import customtkinter as ctk
+    from src.gui import App
 
     ctk.set_appearance_mode("Dark")
     ctk.set_default_color_theme("blue")
-    
+
     app = App()
     app.mainloop()
+
+
+def main(argv):
+    # Check for subprocess wrapper mode (for frozen executable)
+    if len(argv) > 1 and argv[1] == '--esptool-wrapper':
+        import esptool
+        # Pass remaining arguments to esptool
+        # argv[0] is executable path, argv[1] is wrapper flag
+        # so we pass everything starting from index 2
+        esptool.main(argv[2:])
+        return 0
+
+    # Headless flashing driven by a job manifest
+    if len(argv) > 1 and argv[1] == '--batch':
+        from src.batch import main as batch_main
+        return batch_main(argv[2:])
+
+    run_gui()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
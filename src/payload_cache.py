@@ -0,0 +1,204 @@
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+from src.paths import user_cache_dir
+
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+DEFAULT_DISK_LIMIT = 512 * 1024 * 1024
+COMPRESSION_LEVEL = 9  # Same level esptool's write_flash uses
+
+# On-disk entry: uncompressed size, MD5 of the uncompressed data, then the zlib stream
+_HEADER = struct.Struct("<I16s")
+
+
+def default_cache_dir():
+    """Per-user cache directory for compressed payloads."""
+    return os.path.join(user_cache_dir(), "payloads")
+
+
+class Payload:
+    """A flash region compressed the way esptool would send it, with its checksum."""
+
+    def __init__(self, compressed, size, md5):
+        self.compressed = compressed
+        self.size = size
+        self.md5 = md5
+        self._block_lengths = {}
+
+    def blocks(self, write_size):
+        """
+        Returns (compressed_block, uncompressed_length) pairs for write_size blocks.
+
+        The uncompressed lengths drive esptool's per-block write timeouts; they only
+        depend on the block size, so they are worked out once per payload.
+        """
+        if write_size not in self._block_lengths:
+            decompress = zlib.decompressobj()
+            self._block_lengths[write_size] = [
+                len(decompress.decompress(self.compressed[i:i + write_size]))
+                for i in range(0, len(self.compressed), write_size)
+            ]
+        lengths = self._block_lengths[write_size]
+        return [(self.compressed[i * write_size:(i + 1) * write_size], length)
+                for i, length in enumerate(lengths)]
+
+
+class PayloadCache:
+    """
+    Content-addressed cache of compressed flash payloads.
+
+    Entries are keyed by a SHA-256 of the data and the flash parameters, kept in
+    memory up to memory_limit bytes (least recently used first out) and written
+    through to cache_dir, which is trimmed to disk_limit bytes the same way.
+    Safe to share between threads; concurrent requests for the same data only
+    compress it once.
+    """
+
+    def __init__(self, cache_dir=None, memory_limit=DEFAULT_MEMORY_LIMIT, disk_limit=DEFAULT_DISK_LIMIT):
+        self.cache_dir = cache_dir
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._memory_used = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data, flash_params=("keep", "keep", "keep")):
+        digest = hashlib.sha256(data)
+        digest.update(repr((COMPRESSION_LEVEL, tuple(flash_params))).encode())
+        return digest.hexdigest()
+
+    def get(self, data, flash_params=("keep", "keep", "keep")):
+        """Returns the Payload for data, compressing it only if no tier has it yet."""
+        # esptool pads every region to a 4 byte boundary before hashing and compressing
+        if len(data) % 4:
+            data = data + b"\xff" * (4 - len(data) % 4)
+        key = self.key(data, flash_params)
+
+        while True:
+            with self._lock:
+                payload = self._entries.get(key)
+                if payload is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = threading.Event()
+                    break
+            # Another thread is building this entry, wait for it and look again
+            pending.wait()
+
+        try:
+            payload = self._load(key)
+            if payload is None:
+                self.misses += 1
+                payload = Payload(zlib.compress(data, COMPRESSION_LEVEL), len(data),
+                                  hashlib.md5(data).hexdigest())
+                self._store(key, payload)
+            else:
+                self.hits += 1
+            with self._lock:
+                self._remember(key, payload)
+            return payload
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+
+    def warm(self, regions, flash_params=("keep", "keep", "keep")):
+        """Compresses (address, data) regions on a background thread; returns the thread."""
+        def run():
+            for _, data in regions:
+                try:
+                    self.get(data, flash_params)
+                except Exception:
+                    # Warming is best effort, the flash itself will report real errors
+                    pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _remember(self, key, payload):
+        if key in self._entries:
+            return
+        self._entries[key] = payload
+        self._memory_used += len(payload.compressed)
+        while self._memory_used > self.memory_limit and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_used -= len(evicted.compressed)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".z")
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = f.read(_HEADER.size)
+                compressed = f.read()
+        except OSError:
+            return None
+
+        # A truncated or damaged file would fail every flash of this build, so check
+        # it once on its way into memory and drop it if it doesn't hold the data
+        try:
+            size, md5 = _HEADER.unpack(header)
+            data = zlib.decompress(compressed)
+        except (struct.error, zlib.error):
+            data = None
+        if data is None or len(data) != size or hashlib.md5(data).digest() != md5:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        try:
+            # Touch it so disk eviction sees it as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return Payload(compressed, size, md5.hex())
+
+    def _store(self, key, payload):
+        if not self.cache_dir:
+            return
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER.pack(payload.size, bytes.fromhex(payload.md5)))
+                f.write(payload.compressed)
+            os.replace(tmp_path, self._path(key))
+            self._trim_disk()
+        except OSError:
+            # The disk tier is an optimisation; keep working from memory
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _trim_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".z"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_limit:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
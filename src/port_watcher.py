@@ -0,0 +1,192 @@
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import serial.tools.list_ports
+
+from src.events import EventStream
+
+DEFAULT_POLL_INTERVAL = 0.5
+DEFAULT_COOLDOWN = 60.0
+ESPRESSIF_VID = 0x303A
+# USB (VID, PID) of the UART bridges found on ESP32 boards, and of Espressif's own USB
+ESP_USB_IDS = frozenset({
+    (0x10C4, 0xEA60),  # Silicon Labs CP210x
+    (0x1A86, 0x7523),  # WCH CH340
+    (0x1A86, 0x55D4),  # WCH CH9102 / CH343
+    (0x0403, 0x6001),  # FTDI FT232R
+    (0x0403, 0x6010),  # FTDI FT2232 (ESP-Prog)
+    (0x0403, 0x6015),  # FTDI FT231X
+    (0x303A, 0x1001),  # Espressif USB-Serial/JTAG (ESP32-C3/C6/S3/H2)
+    (0x303A, 0x0002),  # Espressif USB-OTG CDC (ESP32-S2/S3 ROM)
+})
+
+
+class PortInfo(NamedTuple):
+    """What list_ports knows about a serial port."""
+    device: str
+    vid: Optional[int]
+    pid: Optional[int]
+    serial_number: Optional[str]
+    description: str
+    hwid: str
+
+    @property
+    def is_native_usb(self):
+        """Espressif's own USB peripheral, which reports the chip's MAC as its serial number."""
+        return self.vid == ESPRESSIF_VID and bool(self.serial_number)
+
+    @property
+    def board_key(self):
+        """
+        Best identity for the board behind the port.
+
+        Only Espressif native USB has a serial number unique to the board (and it
+        re-enumerates on every reset, so the device name can change). UART bridges
+        often share a default serial such as "0001", but stay enumerated through
+        the reset, so for those the device name is the better key.
+        """
+        if self.is_native_usb:
+            return f"{self.vid:04X}:{self.pid:04X}:{self.serial_number}"
+        return self.device
+
+    @classmethod
+    def from_list_ports(cls, info):
+        return cls(info.device, info.vid, info.pid, info.serial_number,
+                   info.description or "", info.hwid or "")
+
+
+class PortAttached(NamedTuple):
+    port: PortInfo
+    timestamp: float
+
+
+class PortDetached(NamedTuple):
+    port: PortInfo
+    timestamp: float
+
+
+class PortWatcher:
+    """
+    Background registry of serial ports that publishes attach/detach events.
+
+    pyserial has no portable hot-plug notification, so the watcher polls
+    comports() and diffs the result against the previous snapshot; nothing is
+    published (and nothing is rebuilt) while the set of ports stays the same.
+    """
+
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self.events = EventStream()
+        # device -> PortInfo for every port currently present
+        self.ports = {}
+        self._signature = frozenset()
+        self._stop = threading.Event()
+        self._thread = None
+        # poll() runs on the watcher thread and on manual refreshes; one diff at a time
+        self._poll_lock = threading.Lock()
+
+    def devices(self):
+        """Sorted device names of the ports currently present."""
+        return sorted(self.ports)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.poll()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                # A flaky enumeration shouldn't kill the watcher; try again next tick
+                pass
+
+    def poll(self):
+        """Takes one snapshot, updates the registry and publishes the differences."""
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self):
+        infos = serial.tools.list_ports.comports()
+        signature = frozenset((info.device, info.hwid) for info in infos)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+
+        current = {info.device: PortInfo.from_list_ports(info) for info in infos}
+        now = time.time()
+        removed = [info for device, info in self.ports.items() if current.get(device) != info]
+        added = [info for device, info in current.items() if self.ports.get(device) != info]
+        self.ports = current
+
+        for info in removed:
+            self.events.publish(PortDetached(info, now))
+        for info in added:
+            self.events.publish(PortAttached(info, now))
+        return True
+
+
+class AutoFlashPolicy:
+    """
+    Decides whether a newly attached port should be flashed automatically.
+
+    A port matches when its (vid, pid) is in vid_pids (or vid_pids is empty).
+    Boards flashed within the last `cooldown` seconds are refused, so the
+    re-enumeration after the post-flash reset doesn't start the job again.
+
+    Boards behind a UART bridge are keyed by device name (see
+    PortInfo.board_key). The bridge stays enumerated through the reset, so once
+    such a port is detached, the next board plugged in there is a different
+    one and detached() lifts the cooldown.
+    """
+
+    def __init__(self, vid_pids=None, cooldown=DEFAULT_COOLDOWN):
+        self.vid_pids = set(vid_pids or ())
+        self.cooldown = cooldown
+        self._done = {}
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def matches(self, port):
+        return not self.vid_pids or (port.vid, port.pid) in self.vid_pids
+
+    def should_flash(self, port):
+        """True if port should be flashed now; marks it active until finished() is called."""
+        return self.claim(port) is None
+
+    def claim(self, port):
+        """
+        Like should_flash(), but returns why the port was refused (None if it was
+        claimed), so callers can tell the operator.
+        """
+        if not self.matches(port):
+            return "not a known ESP32 USB bridge"
+        with self._lock:
+            if port.board_key in self._active:
+                return "already being flashed"
+            done_at = self._done.get(port.board_key)
+            if done_at is not None and time.monotonic() - done_at < self.cooldown:
+                return f"flashed {time.monotonic() - done_at:.0f}s ago"
+            self._active.add(port.board_key)
+            return None
+
+    def detached(self, port):
+        """Forgets the cooldown of a device-keyed port that was unplugged."""
+        if not port.is_native_usb:
+            with self._lock:
+                self._done.pop(port.board_key, None)
+
+    def finished(self, port, success):
+        """Records the outcome; successfully flashed boards enter the cooldown."""
+        with self._lock:
+            self._active.discard(port.board_key)
+            if success:
+                self._done[port.board_key] = time.monotonic()
@@ -0,0 +1,132 @@
+import hashlib
+import struct
+from typing import NamedTuple
+
+FLASH_SECTOR_SIZE = 0x1000
+
+
+def split_blocks(data, block_size, base=0):
+    """Splits data into (address, chunk) blocks of block_size bytes (the last may be shorter)."""
+    return [(base + offset, data[offset:offset + block_size])
+            for offset in range(0, len(data), block_size)]
+
+
+def coalesce(blocks):
+    """Merges address-contiguous (address, chunk) blocks into larger regions."""
+    runs = []
+    end = None
+    for address, chunk in blocks:
+        if runs and address == end:
+            runs[-1][1].append(chunk)
+        else:
+            runs.append((address, [chunk]))
+        end = address + len(chunk)
+    return [(address, b"".join(chunks)) for address, chunks in runs]
+
+
+def diff_regions(image, block_size, remote_md5, base=0):
+    """
+    Compares image against flash block by block and returns (regions, skipped_bytes).
+
+    remote_md5(address, size) must return the hex MD5 of that flash range, e.g.
+    ESPLoader.flash_md5sum. Only blocks whose digest differs end up in regions,
+    merged into as few contiguous writes as possible.
+    """
+    if block_size <= 0 or block_size % FLASH_SECTOR_SIZE:
+        raise ValueError(f"Block size must be a multiple of {FLASH_SECTOR_SIZE:#x} bytes")
+
+    changed = []
+    skipped = 0
+    for address, chunk in split_blocks(image, block_size, base):
+        if hashlib.md5(chunk).hexdigest() == remote_md5(address, len(chunk)):
+            skipped += len(chunk)
+        else:
+            changed.append((address, chunk))
+    return coalesce(changed), skipped
+
+
+PARTITION_TABLE_OFFSET = 0x8000
+PARTITION_MAGIC = b"\xaa\x50"
+PARTITION_ENTRY_SIZE = 32
+PARTITION_TYPE_APP = 0x00
+PARTITION_TYPE_DATA = 0x01
+
+
+class Partition(NamedTuple):
+    label: str
+    type: int
+    subtype: int
+    offset: int
+    size: int
+
+
+def parse_partition_table(image, offset=PARTITION_TABLE_OFFSET):
+    """Returns the partitions found in a merged image, or [] if it has no partition table."""
+    partitions = []
+    for entry_offset in range(offset, offset + FLASH_SECTOR_SIZE, PARTITION_ENTRY_SIZE):
+        entry = image[entry_offset:entry_offset + PARTITION_ENTRY_SIZE]
+        # The table ends with an MD5 entry (0xEBEB) or erased flash
+        if len(entry) < PARTITION_ENTRY_SIZE or entry[:2] != PARTITION_MAGIC:
+            break
+        type_, subtype, part_offset, size = struct.unpack_from("<BBII", entry, 2)
+        label = entry[12:28].split(b"\x00", 1)[0].decode("ascii", "replace")
+        partitions.append(Partition(label, type_, subtype, part_offset, size))
+    return partitions
+
+
+def _areas(partitions, image_end):
+    """Yields (start, end, trimmable) for every partition and the unpartitioned spans between them."""
+    position = 0
+    for partition in sorted(partitions, key=lambda p: p.offset):
+        if partition.offset > position:
+            yield position, partition.offset, True
+        # Only app partitions are read up to their image's end; data, bootloader (0x02) and
+        # custom types may read any sector, so their blank sectors are erased, not skipped
+        yield partition.offset, partition.offset + partition.size, partition.type == PARTITION_TYPE_APP
+        position = max(position, partition.offset + partition.size)
+    if position < image_end:
+        yield position, image_end, True
+
+
+def sparse_regions(image):
+    """
+    Splits a merged image into the sectors that hold data and the all-0xFF gaps between them.
+
+    Returns (write_regions, erase_regions, trimmed_bytes). Blank sectors at the start
+    or end of an app partition, or of the space outside every partition, are never
+    read by the bootloader and are trimmed. All other blank sectors (holes inside an
+    image, data partitions such as nvs and otadata) become erase-only regions, so
+    the flash ends up exactly as a full write would leave it. Without a partition
+    table nothing is trimmed.
+    """
+    partitions = parse_partition_table(image)
+    if partitions:
+        areas = list(_areas(partitions, len(image)))
+    else:
+        areas = [(0, len(image), False)]
+
+    blank = b"\xff" * FLASH_SECTOR_SIZE
+    writes = []
+    erases = []
+    trimmed = 0
+    for start, end, trimmable in areas:
+        blocks = split_blocks(image[start:end], FLASH_SECTOR_SIZE, start)
+        used = [i for i, (_, chunk) in enumerate(blocks) if chunk != blank[:len(chunk)]]
+        first, last = (used[0], used[-1]) if used else (len(blocks), -1)
+        used = set(used)
+        for i, (address, chunk) in enumerate(blocks):
+            if i in used:
+                writes.append((address, chunk))
+            elif trimmable and not first <= i <= last:
+                trimmed += len(chunk)
+            else:
+                # Whole sectors only; a short tail sector is erased in full like write_flash would
+                erases.append((address, FLASH_SECTOR_SIZE))
+
+    erase_regions = []
+    for address, size in erases:
+        if erase_regions and sum(erase_regions[-1]) == address:
+            erase_regions[-1] = (erase_regions[-1][0], erase_regions[-1][1] + size)
+        else:
+            erase_regions.append((address, size))
+    return coalesce(writes), erase_regions, trimmed
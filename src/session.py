@@ -0,0 +1,306 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from esptool.cmds import reset_chip
+from esptool.util import FatalError, UnsupportedCommandError
+from serial import SerialException
+
+from src.baud import is_link_error
+from src.events import ERASE, RESET, VERIFY
+from src.flasher import FlasherInterface, _install_log_adapter, _log_sink
+from src.regions import PARTITION_TABLE_OFFSET, parse_partition_table
+
+DEFAULT_IDLE_TIMEOUT = 30.0
+# The partition table has room for 95 entries plus the MD5 entry
+PARTITION_TABLE_SIZE = 0xC00
+
+# Operations a pipeline step may name
+OPERATIONS = (
+    "erase_flash", "erase_region", "write", "flash_file", "write_partition",
+    "verify", "verify_file", "read", "read_mac", "security_info", "partitions",
+)
+
+
+class DeviceSession:
+    """
+    One stub-loaded connection to a port, kept open across operations.
+
+    The first operation connects, uploads the stub and switches baud rate the
+    same way FlasherInterface does; later ones reuse that connection. Nothing
+    resets the chip until the session is closed, either by close(), at the end
+    of run() (also when a step failed), or once it has sat idle for
+    idle_timeout seconds. An operation that fails on a link error drops the
+    connection and the next one reconnects.
+
+    Every operation can be called directly, or named in a run() pipeline.
+    Sessions are safe to share between threads; operations run one at a time.
+    """
+
+    def __init__(self, port, baud_rate=460800, chip_type="auto", callback=None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, **flasher_options):
+        # The flasher provides connect, write planning, logging and events
+        self.flasher = FlasherInterface(port, None, baud_rate=baud_rate, chip_type=chip_type,
+                                        callback=callback, **flasher_options)
+        self.port = port
+        self.events = self.flasher.events
+        self.idle_timeout = idle_timeout
+        self.esp = None
+        # How many times this session connected and how many operations it ran
+        self.connects = 0
+        self.operations = 0
+        self._partitions = None
+        self._last_used = time.monotonic()
+        self._timer = None
+        self._lock = threading.RLock()
+
+    @property
+    def is_open(self):
+        return self.esp is not None
+
+    def log(self, message):
+        self.flasher.log(message)
+
+    def open(self):
+        """Connects now instead of on the first operation."""
+        with self._operation():
+            pass
+
+    def close(self, reset=True):
+        """Resets the chip into its app (unless reset is False) and closes the port."""
+        with self._lock:
+            self._cancel_idle_close()
+            if self.esp is None:
+                return
+            previous_sink = getattr(_log_sink, "flasher", None)
+            _log_sink.flasher = self.flasher
+            try:
+                if reset:
+                    self.flasher.set_phase(RESET)
+                    reset_chip(self.esp, "hard-reset")
+            finally:
+                _log_sink.flasher = previous_sink
+                self._disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, pipeline, reset=True):
+        """
+        Runs pipeline steps in order over one connection and returns their results.
+
+        A step is an operation name, or a (name, kwargs) tuple, for example
+        ("flash_file", {"path": "app.bin", "offset": 0x10000}). With reset the
+        session is closed after the last step, which is the only reset.
+        """
+        steps = [(step, {}) if isinstance(step, str) else step for step in pipeline]
+        for name, _ in steps:
+            if name not in OPERATIONS:
+                raise ValueError(f"Unknown session operation: {name}")
+
+        results = []
+        try:
+            for name, kwargs in steps:
+                results.append(getattr(self, name)(**kwargs))
+        except Exception:
+            if reset and not self.is_open:
+                # The failed step took the connection with it; reconnect only to reset the
+                # chip, so a failed pipeline doesn't leave the board sitting in the stub
+                try:
+                    self.open()
+                except Exception as e:
+                    self.log(f"Couldn't reconnect to reset {self.port}: {e}\n")
+            raise
+        finally:
+            if reset:
+                self.close()
+        return results
+
+    # Operations
+
+    def erase_flash(self):
+        with self._operation() as esp:
+            self.flasher.set_phase(ERASE)
+            self.log("Erasing flash (this may take a while)...\n")
+            esp.erase_flash()
+            self._partitions = None
+
+    def erase_region(self, address, size):
+        with self._operation() as esp:
+            self.flasher.set_phase(ERASE)
+            self.log(f"Erasing {size} bytes at {address:#010x}...\n")
+            esp.erase_region(address, size)
+            if address <= PARTITION_TABLE_OFFSET < address + size:
+                self._partitions = None
+
+    def write(self, address, data, write_mode="full"):
+        """Writes data at address; returns the write report (bytes written/skipped/erased)."""
+        with self._operation() as esp:
+            self.flasher.flash_offset = address
+            self.flasher.write_mode = write_mode
+            # A write that had to reconnect comes back with a new loader
+            self.esp = self.flasher._write_image(esp, data)
+            if address <= PARTITION_TABLE_OFFSET < address + len(data):
+                self._partitions = None
+            return self.flasher.write_report
+
+    def flash_file(self, path, offset=0x0, write_mode="full"):
+        with open(path, "rb") as f:
+            data = f.read()
+        return self.write(offset, data, write_mode)
+
+    def partitions(self):
+        """The partition table currently in flash, read once per connection."""
+        with self._operation() as esp:
+            if self._partitions is None:
+                table = esp.read_flash(PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE)
+                self._partitions = parse_partition_table(table, 0)
+            return self._partitions
+
+    def write_partition(self, name, data=None, path=None, write_mode="full"):
+        """Writes data (or the contents of path) to the start of the partition labelled name."""
+        if path is not None:
+            with open(path, "rb") as f:
+                data = f.read()
+        partition = next((p for p in self.partitions() if p.label == name), None)
+        if partition is None:
+            raise FatalError(f"No partition named {name!r} on the device")
+        if len(data) > partition.size:
+            raise FatalError(f"{len(data)} bytes don't fit in partition {name!r} ({partition.size} bytes)")
+        self.log(f"Writing partition {name!r} at {partition.offset:#010x}...\n")
+        return self.write(partition.offset, data, write_mode)
+
+    def verify(self, address, data):
+        """Checks flash against data by MD5; raises FatalError if they differ."""
+        with self._operation() as esp:
+            self.flasher.set_phase(VERIFY)
+            # Same padding write_flash applies before it hashes
+            if len(data) % 4:
+                data = data + b"\xff" * (4 - len(data) % 4)
+            expected = hashlib.md5(data).hexdigest()
+            if esp.flash_md5sum(address, len(data)) != expected:
+                raise FatalError(f"Flash at {address:#010x} doesn't match ({len(data)} bytes)")
+            self.log(f"Verified {len(data)} bytes at {address:#010x}.\n")
+            return True
+
+    def verify_file(self, path, offset=0x0):
+        with open(path, "rb") as f:
+            return self.verify(offset, f.read())
+
+    def read(self, address, size):
+        with self._operation() as esp:
+            return esp.read_flash(address, size)
+
+    def read_mac(self):
+        with self._operation() as esp:
+            mac = ":".join(f"{byte:02x}" for byte in esp.read_mac())
+            self.log(f"MAC: {mac}\n")
+            return mac
+
+    def security_info(self):
+        """Secure boot and flash encryption state, plus the loader's security info where supported."""
+        with self._operation() as esp:
+            try:
+                info = esp.get_security_info()
+            except (UnsupportedCommandError, FatalError):
+                # Not implemented by every loader (ESP32); esptool's chip detection falls back the same way
+                info = None
+            return {
+                "secure_boot": esp.get_secure_boot_enabled(),
+                "flash_encryption": esp.get_flash_encryption_enabled(),
+                "security_info": info,
+            }
+
+    # Connection handling
+
+    @contextmanager
+    def _operation(self):
+        with self._lock:
+            self._cancel_idle_close()
+            _install_log_adapter()
+            previous_sink = getattr(_log_sink, "flasher", None)
+            _log_sink.flasher = self.flasher
+            try:
+                if self.esp is None:
+                    self.flasher.phase = None
+                    self.esp = self.flasher._connect()
+                    self.connects += 1
+                yield self.esp
+                self.operations += 1
+            except Exception as e:
+                # A link failure leaves the stub in an unknown state, start over on the next
+                # operation. Anything else (a verify mismatch, a missing partition) keeps it
+                if isinstance(e, (SerialException, OSError)) or is_link_error(e):
+                    self._disconnect()
+                raise
+            finally:
+                _log_sink.flasher = previous_sink
+                self._last_used = time.monotonic()
+                self._schedule_idle_close()
+
+    def _disconnect(self):
+        esp, self.esp = self.esp, None
+        self._partitions = None
+        if esp is not None:
+            try:
+                esp._port.close()
+            except Exception:
+                pass
+
+    def _schedule_idle_close(self):
+        if self.esp is None or not self.idle_timeout:
+            return
+        self._timer = threading.Timer(self.idle_timeout, self._close_if_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_idle_close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _close_if_idle(self):
+        with self._lock:
+            # An operation may have started while this timer was waiting for the lock
+            if self.esp is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+                self.log(f"Session on {self.port} idle for {self.idle_timeout:.0f}s, closing.\n")
+                try:
+                    self.close()
+                except Exception as e:
+                    self.log(f"Error while closing idle session: {e}\n")
+                    self._disconnect()
+
+
+class SessionManager:
+    """Keeps one DeviceSession per port, opened on first use and closed when idle."""
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, **session_options):
+        self.idle_timeout = idle_timeout
+        self.session_options = session_options
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, port):
+        with self._lock:
+            session = self.sessions.get(port)
+            if session is None:
+                session = DeviceSession(port, idle_timeout=self.idle_timeout, **self.session_options)
+                self.sessions[port] = session
+            return session
+
+    def run(self, port, pipeline, reset=True):
+        return self.get(port).run(pipeline, reset=reset)
+
+    def close(self, port, reset=True):
+        with self._lock:
+            session = self.sessions.pop(port, None)
+        if session is not None:
+            session.close(reset=reset)
+
+    def close_all(self, reset=True):
+        for port in list(self.sessions):
+            self.close(port, reset=reset)
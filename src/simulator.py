@@ -0,0 +1,463 @@
+import hashlib
+import os
+import random
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+import zlib
+
+from esptool.loader import ESPLoader
+from esptool.targets import CHIP_DEFS
+
+DEFAULT_FLASH_SIZE = 4 * 1024 * 1024
+# JEDEC ID of the simulated flash (manufacturer 0x20, 4 MB part), read by detect_flash_size
+DEFAULT_FLASH_ID = 0x164020
+# 8N1 framing: start bit, 8 data bits, stop bit
+BITS_PER_BYTE = 10
+# Above max_baud, frames longer than this get corrupted while short commands still pass
+FRAGILE_FRAME_SIZE = 64
+
+CMD = ESPLoader.ESP_CMDS
+# Error codes the ROM and stub put in the second status byte
+INVALID_COMMAND = 0x05
+BAD_DATA_CHECKSUM = 0x07
+INFLATE_ERROR = 0xC3
+
+# SPI peripheral bits used by esptool's run_spiflash_command
+SPI_CMD_USR = 1 << 18
+SPIFLASH_RDID = 0x9F
+
+
+def slip_encode(packet):
+    return b"\xc0" + packet.replace(b"\xdb", b"\xdb\xdd").replace(b"\xc0", b"\xdb\xdc") + b"\xc0"
+
+
+class SlipDecoder:
+    """Splits a byte stream into SLIP frames; bytes outside a frame are dropped."""
+
+    def __init__(self):
+        self._frame = None
+
+    def feed(self, data):
+        frames = []
+        parts = data.split(b"\xc0")
+        for i, part in enumerate(parts):
+            if i > 0:
+                # A delimiter ends the current frame and starts the next one
+                if self._frame:
+                    frames.append(bytes(self._frame).replace(b"\xdb\xdc", b"\xc0").replace(b"\xdb\xdd", b"\xdb"))
+                self._frame = bytearray()
+            if self._frame is not None:
+                self._frame += part
+        return frames
+
+
+class SimulatedDevice:
+    """
+    Software stand-in for an ESP32 in download mode, for tests and benchmarks.
+
+    Speaks esptool's SLIP protocol as the ROM loader and, once the stub has been
+    uploaded, as the flasher stub: sync, register access, RAM download, SPI
+    attach, baud rate changes, plain and compressed flash writes, erase, read,
+    MD5 and reset. Flash contents live in `flash`.
+
+    Serve it on a pseudo-terminal with open_pty() or on a TCP port with
+    listen(), which return the port name to hand to esptool. Every socket
+    connection starts from the ROM loader, like the reset esptool does on a
+    real board. A pty has no DTR/RTS lines, so it behaves like a board whose
+    reset lines aren't wired: the device only goes back to the ROM once
+    nobody has had the port open for a moment.
+
+    throttle makes every byte take as long as it would on a UART at the
+    current baud rate. Above max_baud, long frames are corrupted in both
+    directions, like an adapter that can't keep up. drop_rate and
+    corrupt_rate drop commands or corrupt replies at random, and
+    write_rate / erase_rate (bytes per second) simulate flash chip speed.
+    """
+
+    def __init__(self, chip="esp32", flash_size=DEFAULT_FLASH_SIZE, throttle=True, max_baud=None,
+                 drop_rate=0.0, corrupt_rate=0.0, write_rate=None, erase_rate=None, seed=None):
+        if chip not in CHIP_DEFS or chip == "esp8266":
+            raise ValueError(f"Unsupported chip for the simulator: {chip}")
+        self.chip = CHIP_DEFS[chip]
+        self.flash = bytearray(b"\xff" * flash_size)
+        self.registers = {}
+        self.throttle = throttle
+        self.max_baud = max_baud
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.write_rate = write_rate
+        self.erase_rate = erase_rate
+        self._random = random.Random(seed)
+
+        # Commands handled, by name, and bytes moved in each direction
+        self.stats = {"commands": {}, "bytes_in": 0, "bytes_out": 0, "resets": 0}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._send = None
+        self._reset()
+
+    # Transports
+
+    def open_pty(self):
+        """Serves the device on a new pseudo-terminal and returns its path."""
+        master, slave = os.openpty()
+        # Raw from the start, so nothing is echoed or translated before esptool configures it
+        tty.setraw(slave)
+        path = os.ttyname(slave)
+        # Closing our end of the slave lets us see when esptool closes the port
+        os.close(slave)
+        self._start(self._serve_pty, master)
+        return path
+
+    def listen(self, host="127.0.0.1", port=0):
+        """Serves the device on a TCP port and returns its socket:// URL."""
+        server = socket.create_server((host, port))
+        self._start(self._serve_socket, server)
+        return f"socket://{host}:{server.getsockname()[1]}"
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self, serve, handle):
+        if self._thread is not None:
+            raise RuntimeError("Simulated device is already being served")
+        self._thread = threading.Thread(target=serve, args=(handle,), daemon=True)
+        self._thread.start()
+
+    def _serve_pty(self, master):
+        def send(data):
+            view = memoryview(data)
+            while view:
+                view = view[os.write(master, view):]
+
+        self._send = send
+        decoder = SlipDecoder()
+        connected = False
+        try:
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([master], [], [], 0.05)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(master, 65536)
+                except OSError:
+                    # EIO: nobody has the port open. Treat it as a power cycle
+                    if connected:
+                        connected = False
+                        self._reset()
+                        decoder = SlipDecoder()
+                    time.sleep(0.01)
+                    continue
+                connected = True
+                self._receive(data, decoder)
+        finally:
+            os.close(master)
+
+    def _serve_socket(self, server):
+        server.settimeout(0.05)
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(0.05)
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._send = conn.sendall
+                    decoder = SlipDecoder()
+                    while not self._stopped.is_set():
+                        try:
+                            data = conn.recv(65536)
+                        except socket.timeout:
+                            continue
+                        except OSError:
+                            break
+                        if not data:
+                            break
+                        self._receive(data, decoder)
+                self._reset()
+        finally:
+            server.close()
+
+    # Link
+
+    def _wire_time(self, size):
+        """Waits as long as size bytes take on the wire at the current baud rate."""
+        if self.throttle:
+            self._link_free = max(self._link_free, time.monotonic()) + size * BITS_PER_BYTE / self.baud
+            delay = self._link_free - time.monotonic()
+            if delay > 0.001:
+                time.sleep(delay)
+
+    def _garbled(self, frame):
+        return self.max_baud is not None and self.baud > self.max_baud and len(frame) > FRAGILE_FRAME_SIZE
+
+    def _corrupt(self, frame):
+        i = self._random.randrange(len(frame))
+        return frame[:i] + bytes([frame[i] ^ 0x5A]) + frame[i + 1:]
+
+    def _receive(self, data, decoder):
+        self.stats["bytes_in"] += len(data)
+        self._wire_time(len(data))
+        for frame in decoder.feed(data):
+            if self._garbled(frame):
+                frame = self._corrupt(frame)
+            if self._read_job is not None:
+                self._read_ack(frame)
+            elif self.drop_rate and self._random.random() < self.drop_rate:
+                continue
+            else:
+                self._handle(frame)
+
+    def _write_frame(self, packet, fragile=True):
+        if fragile and (self._garbled(packet) or (self.corrupt_rate and self._random.random() < self.corrupt_rate)):
+            packet = self._corrupt(packet)
+        frame = slip_encode(packet)
+        self._wire_time(len(frame))
+        self.stats["bytes_out"] += len(frame)
+        self._send(frame)
+
+    def _reply(self, op, value=0, data=b"", error=0):
+        # The ROM sends four status bytes, the stub two; the first is 1 on failure
+        status = bytes([1 if error else 0, error]) + (b"" if self.is_stub else b"\x00\x00")
+        body = data + status
+        self._write_frame(struct.pack("<BBHI", 1, op, len(body), value) + body)
+
+    # Device state
+
+    def _reset(self):
+        """Power-on state: ROM loader at 115200 baud, nothing in progress."""
+        self.is_stub = False
+        self.baud = ESPLoader.ESP_ROM_BAUD
+        self._link_free = 0.0
+        self._write = None
+        self._read_job = None
+        self.registers.pop(self.chip.SPI_REG_BASE, None)
+        self.stats["resets"] += 1
+
+    def _read_register(self, address):
+        if address == ESPLoader.CHIP_DETECT_MAGIC_REG_ADDR and self.chip.USES_MAGIC_VALUE:
+            return self.chip.MAGIC_VALUE
+        if address == getattr(self.chip, "UART_CLKDIV_REG", None):
+            # A 40 MHz crystal: esptool works the frequency out from the divider and the baud rate
+            return int(40e6 * getattr(self.chip, "XTAL_CLK_DIVIDER", 1) / self.baud)
+        return self.registers.get(address, 0)
+
+    def _write_register(self, address, value, mask):
+        value = (self.registers.get(address, 0) & ~mask) | (value & mask)
+        spi_cmd = self.chip.SPI_REG_BASE
+        if address == spi_cmd and value & SPI_CMD_USR:
+            # Run the SPI user command at once; only RDID returns anything
+            command = self.registers.get(spi_cmd + self.chip.SPI_USR2_OFFS, 0) & 0xFF
+            self.registers[spi_cmd + self.chip.SPI_W0_OFFS] = DEFAULT_FLASH_ID if command == SPIFLASH_RDID else 0
+            value &= ~SPI_CMD_USR
+        self.registers[address] = value
+
+    def _erase(self, address, size):
+        end = min(address + size, len(self.flash))
+        if address < end:
+            self.flash[address:end] = b"\xff" * (end - address)
+        if self.erase_rate:
+            time.sleep(size / self.erase_rate)
+
+    def _program(self, data):
+        """Writes data at the current write position of a flash_begin/flash_defl_begin."""
+        address = self._write["address"]
+        # NOR flash only clears bits, which is why everything is erased first
+        current = self.flash[address:address + len(data)]
+        self.flash[address:address + len(data)] = bytes(a & b for a, b in zip(current, data))
+        self._write["address"] += len(data)
+        if self.write_rate:
+            time.sleep(len(data) / self.write_rate)
+
+    # Command handling
+
+    def _handle(self, frame):
+        if len(frame) < 8:
+            return
+        direction, op, size, checksum = struct.unpack("<BBHI", frame[:8])
+        data = frame[8:]
+        if direction != 0 or len(data) != size:
+            # Garbled on the way in: the real loader ignores it and esptool times out
+            return
+
+        name = next((name for name, value in CMD.items() if value == op), hex(op))
+        self.stats["commands"][name] = self.stats["commands"].get(name, 0) + 1
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None or (name in _STUB_ONLY and not self.is_stub):
+            self._reply(op, error=INVALID_COMMAND)
+            return
+        handler(op, data, checksum)
+
+    def _cmd_sync(self, op, data, checksum):
+        # The ROM answers a sync several times; the stub's replies carry a 0 value
+        value = 0 if self.is_stub else 0x20120707
+        for _ in range(8):
+            self._reply(op, value)
+
+    def _cmd_read_reg(self, op, data, checksum):
+        (address,) = struct.unpack("<I", data[:4])
+        self._reply(op, self._read_register(address))
+
+    def _cmd_write_reg(self, op, data, checksum):
+        for i in range(0, len(data) - 15, 16):
+            address, value, mask, delay_us = struct.unpack("<IIII", data[i:i + 16])
+            self._write_register(address, value, mask)
+        self._reply(op)
+
+    def _cmd_get_security_info(self, op, data, checksum):
+        if self.chip.USES_MAGIC_VALUE:
+            # Older ROMs (ESP32) don't know this command
+            self._reply(op, error=INVALID_COMMAND)
+            return
+        info = struct.pack("<IB7BII", 0, 0, *([0] * 7), self.chip.IMAGE_CHIP_ID, 0)
+        self._reply(op, data=info)
+
+    def _cmd_mem_begin(self, op, data, checksum):
+        self._reply(op)
+
+    def _cmd_mem_data(self, op, data, checksum):
+        size = struct.unpack("<I", data[:4])[0]
+        block = data[16:16 + size]
+        self._reply(op, error=0 if ESPLoader.checksum(block) == checksum else BAD_DATA_CHECKSUM)
+
+    def _cmd_mem_end(self, op, data, checksum):
+        no_entry, entry = struct.unpack("<II", data[:8])
+        self._reply(op)
+        if not no_entry:
+            # The uploaded code is taken to be the flasher stub, which says hello when it starts
+            self.is_stub = True
+            self._write_frame(b"OHAI", fragile=False)
+
+    def _cmd_spi_attach(self, op, data, checksum):
+        self._reply(op)
+
+    def _cmd_spi_set_params(self, op, data, checksum):
+        self._reply(op)
+
+    def _cmd_change_baudrate(self, op, data, checksum):
+        new_baud, _ = struct.unpack("<II", data[:8])
+        # The reply still goes out at the old rate
+        self._reply(op)
+        self.baud = new_baud
+
+    def _begin_write(self, data, compressed):
+        size, blocks, block_size, address = struct.unpack("<IIII", data[:16])
+        # The ROM erases the range up front, the stub as it writes; either way it ends up erased
+        sector = ESPLoader.FLASH_SECTOR_SIZE
+        self._erase(address, (size + sector - 1) // sector * sector)
+        self._write = {
+            "address": address,
+            "inflate": zlib.decompressobj() if compressed else None,
+        }
+
+    def _cmd_flash_begin(self, op, data, checksum):
+        self._begin_write(data, compressed=False)
+        self._reply(op)
+
+    def _cmd_flash_defl_begin(self, op, data, checksum):
+        self._begin_write(data, compressed=True)
+        self._reply(op)
+
+    def _write_block(self, op, data, checksum):
+        size = struct.unpack("<I", data[:4])[0]
+        block = data[16:16 + size]
+        if self._write is None or len(block) != size or ESPLoader.checksum(block) != checksum:
+            self._reply(op, error=BAD_DATA_CHECKSUM)
+            return
+        inflate = self._write["inflate"]
+        if inflate is not None:
+            try:
+                block = inflate.decompress(block)
+            except zlib.error:
+                self._reply(op, error=INFLATE_ERROR)
+                return
+        self._program(block)
+        self._reply(op)
+
+    def _cmd_flash_data(self, op, data, checksum):
+        self._write_block(op, data, checksum)
+
+    def _cmd_flash_defl_data(self, op, data, checksum):
+        self._write_block(op, data, checksum)
+
+    def _finish_write(self, op, data):
+        self._write = None
+        self._reply(op)
+        (stay_in_loader,) = struct.unpack("<I", data[:4]) if len(data) >= 4 else (1,)
+        if not stay_in_loader:
+            # Run the app: the loader is gone until the next reset
+            self._reset()
+
+    def _cmd_flash_end(self, op, data, checksum):
+        self._finish_write(op, data)
+
+    def _cmd_flash_defl_end(self, op, data, checksum):
+        self._finish_write(op, data)
+
+    def _cmd_spi_flash_md5(self, op, data, checksum):
+        address, size = struct.unpack("<II", data[:8])
+        digest = hashlib.md5(bytes(self.flash[address:address + size]))
+        # The stub sends the raw digest, the ROM sends it as hex text
+        self._reply(op, data=digest.digest() if self.is_stub else digest.hexdigest().encode())
+
+    def _cmd_erase_flash(self, op, data, checksum):
+        self._erase(0, len(self.flash))
+        self._reply(op)
+
+    def _cmd_erase_region(self, op, data, checksum):
+        address, size = struct.unpack("<II", data[:8])
+        self._erase(address, size)
+        self._reply(op)
+
+    def _cmd_read_flash(self, op, data, checksum):
+        address, size, packet_size, max_in_flight = struct.unpack("<IIII", data[:16])
+        self._reply(op)
+        self._read_job = {
+            "data": bytes(self.flash[address:address + size]),
+            "sent": 0,
+            "acked": 0,
+            "packet_size": packet_size,
+            "max_in_flight": max(1, max_in_flight),
+        }
+        self._send_read_packets()
+
+    def _send_read_packets(self):
+        job = self._read_job
+        data = job["data"]
+        while job["sent"] < len(data) and job["sent"] - job["acked"] < job["max_in_flight"] * job["packet_size"]:
+            packet = data[job["sent"]:job["sent"] + job["packet_size"]]
+            self._write_frame(packet)
+            job["sent"] += len(packet)
+
+    def _read_ack(self, frame):
+        """During READ_FLASH every frame from the host acknowledges the bytes it has so far."""
+        job = self._read_job
+        if len(frame) == 4:
+            job["acked"] = struct.unpack("<I", frame)[0]
+        if job["acked"] >= len(job["data"]):
+            self._read_job = None
+            self._write_frame(hashlib.md5(job["data"]).digest())
+        else:
+            self._send_read_packets()
+
+    def _cmd_run_user_code(self, op, data, checksum):
+        # No reply, the app just starts
+        self._reset()
+
+
+# Commands the ROM loader doesn't have
+_STUB_ONLY = {"ERASE_FLASH", "ERASE_REGION", "READ_FLASH", "RUN_USER_CODE"}
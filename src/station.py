@@ -0,0 +1,229 @@
+import queue
+import threading
+import time
+
+from src.events import EventStream
+from src.flasher import FlasherInterface
+from src.payload_cache import PayloadCache
+
+# Job states, in the order a job normally goes through them
+QUEUED = "queued"
+FLASHING = "flashing"
+RETRYING = "retrying"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class PortJob:
+    """State, log and result of flashing one port during a station run."""
+
+    def __init__(self, port, options=None):
+        self.port = port
+        # FlasherInterface arguments that override the station's for this port only
+        self.options = options or {}
+        self.state = QUEUED
+        self.attempts = 0
+        self.progress = None
+        self.log_lines = []
+        self.started_at = None
+        self.finished_at = None
+        # Error and write report of the last attempt
+        self.error = None
+        self.report = None
+
+    @property
+    def last_line(self):
+        for line in reversed(self.log_lines):
+            if line.strip():
+                return line.strip()
+        return ""
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class FlashStation:
+    """Flashes the same firmware to many ports at once with a bounded worker pool."""
+
+    def __init__(self, firmware_path, baud_rate=460800, chip_type="auto", engine="api",
+                 max_workers=4, max_attempts=2, callback=None, **flasher_options):
+        self.firmware_path = firmware_path
+        self.baud_rate = baud_rate
+        self.chip_type = chip_type
+        self.engine = engine
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        # Called with the PortJob whenever its state, log or progress changes
+        self.callback = callback
+        # Any other FlasherInterface keyword arguments (write_mode, ...)
+        self.flasher_options = flasher_options
+        # Every port gets the same image, so compress it once for all of them
+        self.flasher_options.setdefault("payload_cache", PayloadCache())
+        # One event stream for the whole run; events carry their port
+        self.events = self.flasher_options.setdefault("events", EventStream())
+
+        # Latest job per port, for display; all_jobs keeps every job of the run, so a
+        # port flashed again (the next board on a hub port) still counts the earlier one
+        self.jobs = {}
+        self.all_jobs = []
+        self.cancel_requested = False
+        self.started_at = None
+        self.finished_at = None
+        self._queue = queue.Queue()
+        self._workers = []
+        self._active_workers = 0
+        self._lock = threading.Lock()
+
+    def list_ports(self):
+        """Returns a list of available serial ports."""
+        return FlasherInterface(None, None).list_ports()
+
+    @property
+    def is_running(self):
+        return self._active_workers > 0
+
+    def start(self, ports=None):
+        """Queues a job for every port (all detected ports by default) and starts the workers."""
+        if self.is_running:
+            raise RuntimeError("Station run already in progress")
+
+        if ports is None:
+            ports = self.list_ports()
+
+        self.jobs = {}
+        self.all_jobs = []
+        self.cancel_requested = False
+        self.started_at = time.monotonic()
+        self.finished_at = self.started_at if not ports else None
+        for port in ports:
+            self.submit(port)
+
+    def submit(self, port, **options):
+        """
+        Queues one more port, starting a worker if the pool has room.
+
+        Works whether or not a run is in progress, which is how hot-plugged
+        boards join the station. Keyword arguments (firmware_path, baud_rate,
+        flash_offset, ...) override the station settings for this port.
+        Returns the new PortJob.
+        """
+        job = PortJob(port, options)
+        with self._lock:
+            if self._active_workers == 0:
+                self.cancel_requested = False
+                if self.finished_at is not None or self.started_at is None:
+                    # Idle station: this job opens a new measuring window
+                    self.started_at = time.monotonic()
+                self.finished_at = None
+            self.jobs[port] = job
+            self.all_jobs.append(job)
+            self._queue.put(job)
+            if self._active_workers < self.max_workers:
+                self._active_workers += 1
+                worker = threading.Thread(target=self._worker, daemon=True)
+                self._workers = [w for w in self._workers if w.is_alive()] + [worker]
+                worker.start()
+        return job
+
+    def cancel(self):
+        """Stops handing out queued jobs; flashes already running are left to finish."""
+        self.cancel_requested = True
+
+    def wait(self, timeout=None):
+        """Blocks until every worker has exited."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_running:
+            workers = list(self._workers)
+            for worker in workers:
+                worker.join(None if deadline is None else max(0, deadline - time.monotonic()))
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return not self.is_running
+
+    def _notify(self, job):
+        if self.callback:
+            self.callback(job)
+
+    def _worker(self):
+        while True:
+            # Taking the last job and retiring happen under the lock, so submit()
+            # never queues a job that no worker will pick up
+            with self._lock:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    self._active_workers -= 1
+                    if self._active_workers == 0:
+                        self.finished_at = time.monotonic()
+                    return
+
+            if self.cancel_requested:
+                job.state = CANCELLED
+                self._notify(job)
+                continue
+
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job.attempts += 1
+        job.state = FLASHING
+        job.progress = None
+        if job.started_at is None:
+            job.started_at = time.monotonic()
+        self._notify(job)
+
+        def log(message):
+            job.log_lines.append(message)
+            self._notify(job)
+
+        def progress(value):
+            job.progress = value
+            self._notify(job)
+
+        options = dict(
+            firmware_path=self.firmware_path,
+            baud_rate=self.baud_rate,
+            chip_type=self.chip_type,
+            engine=self.engine,
+            **self.flasher_options
+        )
+        options.update(job.options)
+        flasher = FlasherInterface(job.port, callback=log, progress_callback=progress, **options)
+
+        success = flasher.flash()
+        job.error = flasher.last_error
+        job.report = flasher.write_report
+        if success:
+            job.state = DONE
+        elif job.attempts < self.max_attempts and not self.cancel_requested:
+            # Requeue behind the other ports so a flaky board doesn't hold up the batch
+            job.state = RETRYING
+            log(f"\nAttempt {job.attempts} failed, requeueing {job.port}...\n")
+            self._queue.put(job)
+            return
+        else:
+            job.state = FAILED
+        job.finished_at = time.monotonic()
+        self._notify(job)
+
+    def summary(self):
+        """Returns counts, elapsed time and throughput for the current run."""
+        states = [job.state for job in self.all_jobs]
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+
+        succeeded = states.count(DONE)
+        return {
+            "total": len(states),
+            "succeeded": succeeded,
+            "failed": states.count(FAILED),
+            "cancelled": states.count(CANCELLED),
+            "pending": len(states) - succeeded - states.count(FAILED) - states.count(CANCELLED),
+            "elapsed": elapsed,
+            "units_per_minute": succeeded / elapsed * 60 if elapsed > 0 else 0.0,
+        }
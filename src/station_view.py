@@ -0,0 +1,122 @@
+import customtkinter as ctk
+
+from src.log_console import LogConsole
+from src.station import DONE, FAILED, CANCELLED, RETRYING
+
+STATE_COLORS = {
+    DONE: "#2e7d32",
+    FAILED: "#c62828",
+    CANCELLED: "gray50",
+    RETRYING: "#ef6c00",
+}
+
+
+class PortRow(ctk.CTkFrame):
+    """One line of the station view: port, state, progress and the last log line."""
+
+    def __init__(self, master, port, **kwargs):
+        super().__init__(master, **kwargs)
+        self.port = port
+        self.job = None
+        self.grid_columnconfigure(3, weight=1)
+
+        self.enabled = ctk.CTkCheckBox(self, text=port, width=150)
+        self.enabled.grid(row=0, column=0, padx=(10, 5), pady=5, sticky="w")
+        self.enabled.select()
+
+        self.state_label = ctk.CTkLabel(self, text="idle", width=70)
+        self.state_label.grid(row=0, column=1, padx=5)
+
+        self.progress_bar = ctk.CTkProgressBar(self, width=120)
+        self.progress_bar.grid(row=0, column=2, padx=5)
+        self.progress_bar.set(0)
+
+        self.last_line_label = ctk.CTkLabel(self, text="", anchor="w")
+        self.last_line_label.grid(row=0, column=3, padx=5, sticky="ew")
+
+        self.log_btn = ctk.CTkButton(self, text="Log", width=50, command=self.show_log)
+        self.log_btn.grid(row=0, column=4, padx=(5, 10))
+
+    def update_from_job(self, job, earlier_done=0):
+        """Shows job, the port's latest; earlier_done counts the boards already flashed on this port."""
+        self.job = job
+        self.state_label.configure(text=job.state, text_color=STATE_COLORS.get(job.state, ("gray10", "gray90")))
+        if job.state == DONE:
+            self.progress_bar.set(1)
+        elif job.progress is not None:
+            self.progress_bar.set(job.progress.percent / 100)
+        prefix = f"[{earlier_done} earlier done] " if earlier_done else ""
+        self.last_line_label.configure(text=prefix + job.last_line[:80])
+
+    def show_log(self):
+        if self.job is None:
+            return
+        window = ctk.CTkToplevel(self)
+        window.title(f"Log - {self.port}")
+        window.geometry("600x400")
+        console = LogConsole(window)
+        console.pack(expand=True, fill="both", padx=10, pady=10)
+        console.write("".join(self.job.log_lines))
+        console.flush()
+
+
+class StationView(ctk.CTkFrame):
+    """Shows every port of a station run side by side with a throughput summary."""
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.station = None
+        self.rows = {}
+        self._refreshing = False
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        self.rows_frame = ctk.CTkScrollableFrame(self)
+        self.rows_frame.grid(row=0, column=0, sticky="nsew")
+        self.rows_frame.grid_columnconfigure(0, weight=1)
+
+        self.summary_label = ctk.CTkLabel(self, text="", anchor="w")
+        self.summary_label.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
+
+    def set_ports(self, ports):
+        """Rebuilds the rows for the given ports, keeping the checkbox state of known ones."""
+        for port in list(self.rows):
+            if port not in ports:
+                self.rows.pop(port).destroy()
+        for port in ports:
+            if port not in self.rows:
+                self.rows[port] = PortRow(self.rows_frame, port)
+        for i, port in enumerate(ports):
+            self.rows[port].grid(row=i, column=0, padx=5, pady=2, sticky="ew")
+
+    def selected_ports(self):
+        return [port for port, row in self.rows.items() if row.enabled.get()]
+
+    def attach(self, station):
+        """Starts following a running station; refreshes until it is done."""
+        self.station = station
+        if not self._refreshing:
+            self.refresh()
+
+    def refresh(self):
+        if self.station is None:
+            return
+
+        earlier_done = {}
+        for job in self.station.all_jobs:
+            if job.state == DONE and job is not self.station.jobs.get(job.port):
+                earlier_done[job.port] = earlier_done.get(job.port, 0) + 1
+        for port, job in self.station.jobs.items():
+            if port in self.rows:
+                self.rows[port].update_from_job(job, earlier_done.get(port, 0))
+
+        summary = self.station.summary()
+        self.summary_label.configure(
+            text=f"{summary['succeeded']}/{summary['total']} done, {summary['failed']} failed, "
+                 f"{summary['elapsed']:.0f}s elapsed, {summary['units_per_minute']:.1f} units/min"
+        )
+
+        # Only one refresh loop at a time, however often attach() is called
+        self._refreshing = self.station.is_running
+        if self._refreshing:
+            self.after(250, self.refresh)